@@ -0,0 +1,96 @@
+"""
+Benchmark the ClickUp integration against the local fake server.
+
+Reports wall time, request count and peak traced memory of `ClickupData.update`
+and `ClickupCog.parse_tasks` for several workspace sizes. The fake server runs in the
+same process, so its time is included; tracing memory also slows everything down,
+pass `--no-memory` for cleaner timings.
+
+    python -m bench.clickup [--sizes 10 1000 50000] [--latency 0.02] [--no-memory]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+import discord
+from bench.fake_clickup import FakeClickup, synthetic_workspace
+from sus.basiclib import convert_bytes
+from sus.config import config_handler
+from sus.clickup import ClickupCog, ClickupData, SUBTASK_EXPAND
+from sus.clickup.client import close_session
+
+
+def load_config(endpoint: str):
+    config_handler.load({
+        "token": "bench",
+        "swapfinder": {"scan_path": "/tmp", "report_channel_id": 0},
+        "clickup": {"token": "bench", "mention_id": 0, "report_channel_id": 0, "api_endpoint": endpoint,
+                    "snapshot_path": ""},
+    })
+
+
+async def measure(fake: FakeClickup, name: str, func) -> dict:
+    fake.reset_stats()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    await func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    if not tracemalloc.is_tracing():
+        base, peak = 0, None
+    return {"case": name, "time": elapsed, "requests": fake.requests, "throttled": fake.throttled,
+            "peak": None if peak is None else max(0, peak - base)}
+
+
+async def bench_size(num_tasks: int, args) -> list[dict]:
+    fake = FakeClickup(synthetic_workspace(num_tasks), latency=args.latency, page_size=args.page_size,
+                       rate_limit=args.rate_limit)
+    load_config(await fake.start())
+    results = []
+    try:
+        data = ClickupData(max_child=SUBTASK_EXPAND)
+        results.append(await measure(fake, "update (cold)", data.update))
+        results.append(await measure(fake, "update (incremental)", data.update))
+        results.append(await measure(fake, "update (full)", lambda: data.update(full=True)))
+
+        cog = ClickupCog(discord.Bot())
+        try:
+            results.append(await measure(fake, "parse_tasks (cold)", cog.parse_tasks))
+            results.append(await measure(fake, "parse_tasks (cached)", cog.parse_tasks))
+            results.append(await measure(fake, "parse_tasks (forced)", lambda: cog.parse_tasks(force=True)))
+        finally:
+            cog.prober.cancel()
+    finally:
+        await close_session()
+        await fake.stop()
+    return results
+
+
+def format_bytes(n: int | None) -> str:
+    if n is None:
+        return "-"
+    return convert_bytes(n) or "0 B"
+
+
+async def main(args):
+    if args.memory:
+        tracemalloc.start()
+    print(f"{'tasks':>7} {'case':<22} {'time':>10} {'requests':>9} {'429s':>5} {'peak memory':>12}")
+    for size in args.sizes:
+        for result in await bench_size(size, args):
+            print(f"{size:>7} {result['case']:<22} {result['time'] * 1000:>8.1f}ms {result['requests']:>9} "
+                  f"{result['throttled']:>5} {format_bytes(result['peak']):>12}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the ClickUp integration against a fake server.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 50000], help="number of tasks")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per minute before 429s")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="do not trace memory")
+    asyncio.run(main(parser.parse_args()))
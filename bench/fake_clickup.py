@@ -0,0 +1,241 @@
+"""
+A local fake of the parts of the ClickUp API the bot uses.
+
+It serves recorded or synthetic teams, spaces, lists and tasks, with configurable latency,
+pagination and injected 429 responses, so the ClickUp integration can be measured without a token.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+from aiohttp import web
+
+USER_ID = 1
+OPEN_STATUS = {"id": "s_open", "status": "to do", "type": "open", "orderindex": 0, "color": "#d3d3d3"}
+CUSTOM_STATUS = {"id": "s_custom", "status": "in progress", "type": "custom", "orderindex": 1, "color": "#4194f6"}
+CLOSED_STATUS = {"id": "s_closed", "status": "complete", "type": "closed", "orderindex": 2, "color": "#6bc950"}
+TAGS = ["course", "assignment", "exam", "event", "meeting"]
+
+
+def synthetic_task(list_id: str, index: int, parent: str | None = None, now: float | None = None) -> dict:
+    """A task of list `list_id` shaped like ClickUp's, with due dates spread over the surrounding weeks."""
+    now = now or time.time()
+    rand = random.Random(f"{list_id}/{index}")
+    task_id = f"{list_id}t{index}"
+    return {
+        "id": task_id,
+        "name": f"Task {index} of list {list_id}",
+        "text_content": "Lorem ipsum dolor sit amet. " * rand.randint(0, 8),
+        "status": rand.choice([OPEN_STATUS, OPEN_STATUS, CUSTOM_STATUS, CLOSED_STATUS]),
+        "tags": [{"name": tag} for tag in rand.sample(TAGS, rand.randint(0, 2))],
+        "assignees": [{"id": USER_ID}],
+        "date_created": str(int((now - 86400 * 30) * 1000)),
+        "date_updated": str(int((now - rand.uniform(3600, 86400 * 7)) * 1000)),
+        "due_date": str(int((now + rand.uniform(-86400 * 3, 86400 * 14)) * 1000)) if rand.random() < 0.9 else None,
+        "parent": parent,
+        "url": f"https://app.clickup.com/t/{task_id}",
+    }
+
+
+def synthetic_workspace(num_tasks: int, teams: int = 1, spaces: int = 2, lists: int = 5,
+                        subtask_ratio: float = 0.2) -> dict:
+    r"""
+    Build a workspace of `num_tasks` tasks spread evenly over `teams` * `spaces` * `lists` lists.
+
+    :param subtask_ratio: Fraction of tasks that are subtasks of an earlier task in the same list.
+    :return: A workspace in the format accepted by `FakeClickup`, see `FakeClickup.__init__`.
+    """
+    now = time.time()
+    workspace = {"teams": [], "spaces": {}, "lists": {}, "list_meta": {}, "tasks": {}}
+    all_lists = []
+    for t in range(teams):
+        team_id = str(100 + t)
+        workspace["teams"].append({"id": team_id, "name": f"Team {t}"})
+        workspace["spaces"][team_id] = []
+        for s in range(spaces):
+            space_id = f"{team_id}{s:02d}"
+            workspace["spaces"][team_id].append({"id": space_id, "name": f"Space {s}"})
+            workspace["lists"][space_id] = []
+            for l in range(lists):
+                list_id = f"{space_id}{l:02d}"
+                workspace["lists"][space_id].append({"id": list_id, "name": f"List {l}"})
+                workspace["list_meta"][list_id] = {"id": list_id, "name": f"List {l}",
+                                                   "statuses": [OPEN_STATUS, CUSTOM_STATUS, CLOSED_STATUS]}
+                workspace["tasks"][list_id] = []
+                all_lists.append(list_id)
+
+    rand = random.Random(num_tasks)
+    for i in range(num_tasks):
+        list_id = all_lists[i % len(all_lists)]
+        tasks = workspace["tasks"][list_id]
+        parent = None
+        parents = [task for task in tasks[-20:] if task["parent"] is None and task["status"]["type"] != "closed"]
+        if parents and rand.random() < subtask_ratio:
+            parent = rand.choice(parents)["id"]
+        tasks.append(synthetic_task(list_id, len(tasks), parent, now))
+    return workspace
+
+
+class FakeClickup:
+    def __init__(self, workspace: dict, latency: float = 0, page_size: int = 100,
+                 rate_limit: int | None = None, rate_window: float = 60, error_rate: float = 0):
+        r"""
+        Serve `workspace` over HTTP.
+
+        :param workspace: A dict with `teams` (list), `spaces` (by team id), `lists` (by space id),
+                          `list_meta` (by list id) and `tasks` (by list id), holding ClickUp JSON objects.
+        :param latency: Seconds added to every response.
+        :param page_size: Tasks per page of `list/{id}/task`.
+        :param rate_limit: Requests allowed per `rate_window` seconds; further requests get a 429.
+        :param error_rate: Probability that a request randomly fails with a 429.
+        """
+        self.workspace = workspace
+        self.latency = latency
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.error_rate = error_rate
+
+        self.requests = 0
+        self.throttled = 0
+        self.window_start = time.time()
+        self.window_count = 0
+
+        self.app = web.Application()
+        self.app.router.add_get("/api/v2/user", self.get_user)
+        self.app.router.add_get("/api/v2/team", self.get_teams)
+        self.app.router.add_get("/api/v2/team/{id}/space", self.get_spaces)
+        self.app.router.add_get("/api/v2/space/{id}/list", self.get_lists)
+        self.app.router.add_get("/api/v2/list/{id}", self.get_list)
+        self.app.router.add_get("/api/v2/list/{id}/task", self.get_tasks)
+        self.filtered: dict[tuple, list[dict] | None] = {}
+        self.runner: web.AppRunner | None = None
+        self.url: str | None = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> FakeClickup:
+        """Serve a workspace recorded as JSON at `path`."""
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the API endpoint, ending with `/`."""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/api/v2/"
+        return self.url
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def invalidate(self):
+        """Forget cached query results. Call this after changing `workspace`."""
+        self.filtered.clear()
+
+    def reset_stats(self):
+        self.requests = 0
+        self.throttled = 0
+
+    def rate_headers(self) -> dict:
+        if self.rate_limit is None:
+            return {}
+        return {"X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(max(0, self.rate_limit - self.window_count)),
+                "X-RateLimit-Reset": str(int(self.window_start + self.rate_window) + 1)}
+
+    async def respond(self, payload: dict | None) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        now = time.time()
+        if now - self.window_start >= self.rate_window:
+            self.window_start, self.window_count = now, 0
+        self.window_count += 1
+
+        limited = self.rate_limit is not None and self.window_count > self.rate_limit
+        if limited or random.random() < self.error_rate:
+            self.throttled += 1
+            return web.json_response({"err": "Rate limit reached", "ECODE": "APP_002"}, status=429,
+                                     headers=self.rate_headers())
+        if payload is None:
+            return web.json_response({"err": "Not found"}, status=404, headers=self.rate_headers())
+        return web.json_response(payload, headers=self.rate_headers())
+
+    async def get_user(self, request: web.Request):
+        return await self.respond({"user": {"id": USER_ID, "username": "bench"}})
+
+    async def get_teams(self, request: web.Request):
+        return await self.respond({"teams": self.workspace["teams"]})
+
+    async def get_spaces(self, request: web.Request):
+        spaces = self.workspace["spaces"].get(request.match_info["id"])
+        return await self.respond(None if spaces is None else {"spaces": spaces})
+
+    async def get_lists(self, request: web.Request):
+        lists = self.workspace["lists"].get(request.match_info["id"])
+        return await self.respond(None if lists is None else {"lists": lists})
+
+    async def get_list(self, request: web.Request):
+        return await self.respond(self.workspace["list_meta"].get(request.match_info["id"]))
+
+    def filter_tasks(self, list_id: str, query) -> list[dict] | None:
+        tasks = self.workspace["tasks"].get(list_id)
+        if tasks is None:
+            return None
+
+        statuses = set(query.getall("statuses", []))
+        assignees = {int(ele) for ele in query.getall("assignees", [])}
+        updated_after = int(query.get("date_updated_gt", 0))
+        include_closed = query.get("include_closed") == "true"
+        if not query.get("subtasks") == "true":
+            tasks = [task for task in tasks if task["parent"] is None]
+        if statuses:
+            tasks = [task for task in tasks if task["status"]["status"] in statuses]
+        elif not include_closed:
+            tasks = [task for task in tasks if task["status"]["type"] != "closed"]
+        if assignees:
+            tasks = [task for task in tasks if any(user["id"] in assignees for user in task["assignees"])]
+        if updated_after:
+            tasks = [task for task in tasks if int(task["date_updated"]) > updated_after]
+        return tasks
+
+    async def get_tasks(self, request: web.Request):
+        # Pages of one query share the filtered result, so the fake itself stays linear in the list size
+        key = (request.match_info["id"],
+               tuple(sorted((k, v) for k, v in request.query.items() if k != "page")))
+        if key not in self.filtered:
+            self.filtered[key] = self.filter_tasks(request.match_info["id"], request.query)
+        tasks = self.filtered[key]
+        if tasks is None:
+            return await self.respond(None)
+
+        page = int(request.query.get("page", 0))
+        chunk = tasks[page * self.page_size:(page + 1) * self.page_size]
+        return await self.respond({"tasks": chunk, "last_page": (page + 1) * self.page_size >= len(tasks)})
+
+
+async def serve(args):
+    if args.workspace:
+        fake = FakeClickup.from_file(args.workspace, latency=args.latency, rate_limit=args.rate_limit)
+    else:
+        fake = FakeClickup(synthetic_workspace(args.tasks), latency=args.latency, rate_limit=args.rate_limit)
+    print(f"Serving fake ClickUp at {await fake.start(port=args.port)}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a fake ClickUp API server.")
+    parser.add_argument("--workspace", help="JSON file of a recorded workspace")
+    parser.add_argument("--tasks", type=int, default=1000, help="number of synthetic tasks")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per minute")
+    parser.add_argument("--port", type=int, default=8900)
+    asyncio.run(serve(parser.parse_args()))
@@ -0,0 +1,165 @@
+"""
+Write synthetic vim swap files, laid out the way vim writes them (64-bit, native byte order),
+so the swap file finder can be measured without anyone editing files.
+
+Besides well-formed files, `write_corrupt` produces the kinds of damage found in a real /tmp:
+truncated files, garbage with a swap file name, and pointers to blocks vim never wrote.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import struct
+import sys
+from sus.swapfinder.swapparser import (B0_FNAME, B0_FLAGS, B0_MAGIC, B0_MAGIC_CHAR, B0_MAGIC_INT, B0_MAGIC_LONG,
+                                       B0_MAGIC_SHORT, B0_PAGE_SIZE, B0_SAME_DIR, B0_UNAME, DATA_ID, PTR_ID)
+
+PAGE_SIZE = 4096
+ENDIAN = "<" if sys.byteorder == "little" else ">"
+DATA_HEADER = struct.Struct(f"{ENDIAN}H2xIIIq")
+INDEX = struct.Struct(f"{ENDIAN}I")
+PTR_HEADER = struct.Struct(f"{ENDIAN}HHH2x")
+PTR_ENTRY = struct.Struct(f"{ENDIAN}qqqi4x")
+B0_DIRTY = 0x55
+
+WORDS = ["int", "main", "return", "for", "while", "printf", "vector", "struct", "if", "else", "std", "cout",
+         "include", "void", "const", "auto", "size_t", "nullptr", "template", "class", "i", "j", "n", "0", "1"]
+
+
+def synthetic_lines(count: int, seed: int | str = 0) -> list[bytes]:
+    """`count` lines of something that looks like source code."""
+    rand = random.Random(seed)
+    return [(" " * rand.choice([0, 4, 8]) + " ".join(rand.choices(WORDS, k=rand.randint(0, 12)))).encode()
+            for _ in range(count)]
+
+
+def block0(fname: str, page_size: int = PAGE_SIZE, uname: str = "student") -> bytes:
+    block = bytearray(page_size)
+    block[0:2] = b"b0"
+    block[2:12] = b"VIM 9.0".ljust(10, b"\0")
+    block[B0_PAGE_SIZE:B0_PAGE_SIZE + 4] = page_size.to_bytes(4, "little")
+    block[B0_UNAME:B0_UNAME + 40] = uname.encode()[:39].ljust(40, b"\0")
+    block[68:108] = b"localhost".ljust(40, b"\0")
+    block[B0_FNAME:B0_FNAME + len(fname.encode()[:800])] = fname.encode()[:800]
+    block[B0_FLAGS] = B0_SAME_DIR | 1 # fileformat unix
+    block[B0_FLAGS + 1] = B0_DIRTY
+    struct.pack_into(f"{ENDIAN}qihB", block, B0_MAGIC, B0_MAGIC_LONG, B0_MAGIC_INT, B0_MAGIC_SHORT, B0_MAGIC_CHAR)
+    return bytes(block)
+
+
+def data_block(lines: list[bytes], page_size: int = PAGE_SIZE) -> bytes:
+    """A data block holding `lines`, as many pages as needed. Text is stored backwards from the end."""
+    text_size = sum(len(line) + 1 for line in lines)
+    needed = DATA_HEADER.size + INDEX.size * len(lines) + text_size
+    pages = -(-needed // page_size)
+    block = bytearray(pages * page_size)
+    end = len(block)
+    for i, line in enumerate(lines):
+        start = end - len(line) - 1
+        block[start:end - 1] = line
+        INDEX.pack_into(block, DATA_HEADER.size + i * INDEX.size, start)
+        end = start
+    DATA_HEADER.pack_into(block, 0, DATA_ID, end - DATA_HEADER.size - INDEX.size * len(lines), end, len(block), len(lines))
+    return bytes(block)
+
+
+def pack_lines(lines: list[bytes], page_size: int = PAGE_SIZE) -> list[list[bytes]]:
+    """Split `lines` into data blocks the way vim fills them: as many lines as fit in a page."""
+    blocks, current, used = [], [], DATA_HEADER.size
+    for line in lines:
+        cost = INDEX.size + len(line) + 1
+        if current and used + cost > page_size:
+            blocks.append(current)
+            current, used = [], DATA_HEADER.size
+        current.append(line)
+        used += cost
+    if current or not blocks:
+        blocks.append(current)
+    return blocks
+
+
+def build_swap(lines: list[bytes], fname: str, page_size: int = PAGE_SIZE, missing: float = 0.0,
+               seed: int | str = 0) -> bytes:
+    r"""
+    The contents of a swap file for a buffer holding `lines`.
+
+    :param missing: Fraction of data blocks left out, as if vim never wrote them to disk.
+    """
+    rand = random.Random(seed)
+    count_max = (page_size - PTR_HEADER.size) // PTR_ENTRY.size
+    pages = {0: block0(fname, page_size)}
+    next_block = 2 # block 1 is the root pointer block
+
+    # Leaves: (bnum, line_count, old_lnum, page_count)
+    entries, lnum = [], 1
+    for chunk in pack_lines(lines, page_size):
+        if missing and rand.random() < missing:
+            entries.append((-next_block, len(chunk), lnum, 1))
+            next_block += 1
+        else:
+            block = data_block(chunk, page_size)
+            entries.append((next_block, len(chunk), lnum, len(block) // page_size))
+            pages[next_block] = block
+            next_block += len(block) // page_size
+        lnum += len(chunk)
+
+    # Group entries into pointer blocks until they fit in the root
+    while len(entries) > count_max:
+        parents = []
+        for i in range(0, len(entries), count_max):
+            group = entries[i:i + count_max]
+            pages[next_block] = pointer_block(group, count_max, page_size)
+            parents.append((next_block, sum(entry[1] for entry in group), group[0][2], 1))
+            next_block += 1
+        entries = parents
+    pages[1] = pointer_block(entries, count_max, page_size)
+
+    out = bytearray(next_block * page_size)
+    for bnum, block in pages.items():
+        out[bnum * page_size:bnum * page_size + len(block)] = block
+    return bytes(out)
+
+
+def pointer_block(entries: list[tuple], count_max: int, page_size: int = PAGE_SIZE) -> bytes:
+    block = bytearray(page_size)
+    PTR_HEADER.pack_into(block, 0, PTR_ID, len(entries), count_max)
+    for i, entry in enumerate(entries):
+        PTR_ENTRY.pack_into(block, PTR_HEADER.size + i * PTR_ENTRY.size, *entry)
+    return bytes(block)
+
+
+def swap_name(dir: str, name: str) -> str:
+    """Where vim puts the swap file of `dir/name` when 'directory' is ".": `dir/.name.swp`."""
+    return os.path.join(dir, f".{name}.swp")
+
+
+def write_swap(dir: str, name: str, lines: list[bytes], **kwargs) -> str:
+    """Write the swap file of `dir/name` holding `lines` and return its path, see `build_swap`."""
+    path = swap_name(dir, name)
+    with open(path, "wb") as f:
+        f.write(build_swap(lines, os.path.join(dir, name), **kwargs))
+    return path
+
+
+def write_corrupt(dir: str, name: str, kind: str, seed: int | str = 0) -> str:
+    r"""
+    Write a damaged swap file and return its path.
+
+    :param kind: "truncated" (cut inside the block tree), "garbage" (random bytes),
+                 or "missing" (half the data blocks never written, and no original file to fill them from).
+    """
+    rand = random.Random(seed)
+    path = swap_name(dir, name)
+    if kind == "truncated":
+        data = build_swap(synthetic_lines(2000, seed), os.path.join(dir, name))
+        data = data[:rand.randrange(PAGE_SIZE + 16, len(data) - PAGE_SIZE)]
+    elif kind == "garbage":
+        data = rand.randbytes(rand.randint(1, 8) * PAGE_SIZE)
+    elif kind == "missing":
+        data = build_swap(synthetic_lines(2000, seed), os.path.join(dir, name), missing=0.5, seed=seed)
+    else:
+        raise ValueError(f"unknown kind of corruption {kind!r}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
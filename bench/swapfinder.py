@@ -0,0 +1,273 @@
+"""
+Benchmark the swap file finder on synthetic directories.
+
+`walk` lists a directory of mostly unrelated files (by default 100k, 1% of them swap files) the way a
+scan does, and compares it with the listing loop `scan_with_callback` used before it was rewritten.
+
+`recover` fills a directory with small, large and corrupt swap files among decoys (see `bench.fake_swap`)
+and times `recover_swap_file`, `scan_directory` and `scan_with_callback`. It reports files per second,
+per-file latency percentiles and the peak RSS of the bot and its recovery workers, to size
+`swapfinder.max_file_size`, `swapfinder.workers` and the polling interval.
+For the scans, the latency of a file is the time from the start of the scan until its result arrives.
+
+    python -m bench.swapfinder walk [--files 100000] [--swap-ratio 0.01] [--subdirs 0] [--depth 0]
+    python -m bench.swapfinder recover [--small 500] [--large 5] [--large-lines 50000] [--corrupt 30] [--workers 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import random
+import re
+import stat
+import statistics
+import tempfile
+import threading
+import time
+from pwd import getpwuid
+import psutil
+from bench.fake_swap import synthetic_lines, write_corrupt, write_swap
+from sus.basiclib import convert_bytes
+from sus.config import config_handler
+from sus.swapfinder.swapfinder import PREVIEW_BYTES_PER_CHAR, VimSwapFileFinder
+
+CORRUPTIONS = ["truncated", "garbage", "missing"]
+
+
+def load_config(scan_path: str, **swapfinder):
+    config_handler.load({
+        "token": "bench",
+        "swapfinder": {"scan_path": scan_path, "report_channel_id": 0, **swapfinder},
+        "clickup": {"token": "bench", "mention_id": 0, "report_channel_id": 0},
+    })
+
+
+def make_tree(root: str, files: int, swap_ratio: float, subdirs: int = 0) -> int:
+    """
+    Fill `root` with `files` empty files, spread over `subdirs` subdirectories (none: all in `root`).
+    Every 1 / `swap_ratio`-th file is a swap file, the rest are decoys. Return the number of swap files.
+    """
+    dirs = [root] + [os.path.join(root, f"user{i}") for i in range(subdirs)]
+    for dir in dirs[1:]:
+        os.mkdir(dir)
+    every = max(1, round(1 / swap_ratio)) if swap_ratio > 0 else 0
+    swaps = 0
+    for i in range(files):
+        if every and i % every == 0:
+            name = f".file{i}.txt.sw{'pox'[i % 3]}"
+            swaps += 1
+        else:
+            name = f"file{i}.{['txt', 'c', 'py', 'o'][i % 4]}"
+        with open(os.path.join(dirs[i % len(dirs)], name), "w"):
+            pass
+    return swaps
+
+
+def legacy_walk(dir: str, last_check: datetime.datetime, max_file_size: int) -> list:
+    """The listing part of `scan_with_callback` before it was rewritten, for comparison."""
+    found = []
+    with os.scandir(dir) as dir_entries:
+        for entry in dir_entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            st_mode = entry.stat(follow_symlinks=False).st_mode
+            if not st_mode & (stat.S_IRGRP):
+                continue
+            fullname = dir + '/' + entry.name
+            if not re.match(r"^.*\.sw.$", fullname):
+                continue
+            if entry.stat().st_size > max_file_size:
+                continue
+            last_modify = datetime.datetime.fromtimestamp(entry.stat().st_mtime)
+            if last_modify < last_check:
+                continue
+            owner = getpwuid(entry.stat().st_uid).pw_name
+            found.append((fullname, entry.stat().st_size, owner, last_modify))
+    return found
+
+
+def timed(func, repeat: int) -> tuple[float, int]:
+    """Median wall time of `repeat` calls of `func`, and the length of its result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), len(result)
+
+
+def bench_walk(args):
+    with tempfile.TemporaryDirectory(prefix="swapbench") as root:
+        start = time.perf_counter()
+        swaps = make_tree(root, args.files, args.swap_ratio, args.subdirs)
+        print(f"Created {args.files} files ({swaps} swap files) in {time.perf_counter() - start:.1f}s")
+
+        load_config(root, scan_depth=args.depth, index_path="")
+        sf = VimSwapFileFinder()
+        sf.update_time(datetime.datetime(2000, 1, 1))
+        max_file_size = config_handler.get_configuration("swapfinder.max_file_size")
+
+        print(f"{'walk':<12} {'median':>10} {'files/s':>12} {'found':>7}")
+        cases = [("new", lambda: sf.find_candidates(root))]
+        if args.depth == 0:
+            cases.insert(0, ("legacy", lambda: legacy_walk(root, sf.last_check, max_file_size)))
+        for name, func in cases:
+            elapsed, found = timed(func, args.repeat)
+            print(f"{name:<12} {elapsed * 1000:>8.1f}ms {args.files / elapsed:>12,.0f} {found:>7}")
+
+
+def make_corpus(root: str, args) -> dict[str, list[str]]:
+    """Write the swap files and decoys of the `recover` benchmark into `root`, and return the swap files by kind."""
+    corpus = {"small": [], "large": [], "corrupt": []}
+    for i in range(args.small):
+        # Mostly short files, as students' solutions are, with a long tail
+        count = min(300, int(random.Random(i).paretovariate(1.2) * 10))
+        corpus["small"].append(write_swap(root, f"small{i}.cpp", synthetic_lines(count, f"small{i}")))
+    for i in range(args.large):
+        corpus["large"].append(write_swap(root, f"large{i}.cpp", synthetic_lines(args.large_lines, f"large{i}")))
+    for i in range(args.corrupt):
+        corpus["corrupt"].append(write_corrupt(root, f"corrupt{i}.cpp", CORRUPTIONS[i % len(CORRUPTIONS)], seed=i))
+    make_tree(root, args.decoys, 0)
+    return corpus
+
+
+class RSSSampler:
+    """Sample the RSS of this process and all its descendants (the recovery workers) in a background thread."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval: float = interval
+        self.peak: int = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self) -> int:
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.sample())
+
+    def __enter__(self):
+        self.peak = self.sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def percentile(samples: list[float], p: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[p - 1]
+
+
+def report(name: str, files: int, elapsed: float, latencies: list[float], peak: int):
+    p50, p95, p99 = (percentile(latencies, p) * 1000 for p in (50, 95, 99))
+    print(f"{name:<30} {files:>6} {elapsed:>8.2f}s {files / elapsed:>9.1f} "
+          f"{p50:>8.1f}ms {p95:>8.1f}ms {p99:>8.1f}ms {convert_bytes(peak):>12}")
+
+
+def bench_recover_swap_file(sf: VimSwapFileFinder, paths: list[str], getfile: bool) -> tuple[float, list[float]]:
+    limit = None if getfile else config_handler.get_configuration("swapfinder.preview_size") * PREVIEW_BYTES_PER_CHAR
+    latencies = []
+    start = time.perf_counter()
+    for path in paths:
+        begin = time.perf_counter()
+        content = sf.recover_swap_file(path, getfile, limit)
+        latencies.append(time.perf_counter() - begin)
+        if getfile and content is not None:
+            content.close()
+    return time.perf_counter() - start, latencies
+
+
+def bench_scan_directory(sf: VimSwapFileFinder, root: str, keepfile: bool) -> tuple[float, list[float]]:
+    start = time.perf_counter()
+    found = sf.scan_directory(root, keepfile, dedup=False)
+    elapsed = time.perf_counter() - start
+    for content in found:
+        if keepfile:
+            content.preview.close()
+    # Results are only available together
+    return elapsed, [elapsed] * len(found)
+
+
+def bench_scan_with_callback(sf: VimSwapFileFinder, root: str) -> tuple[float, list[float]]:
+    sf.index.entries.clear() # report everything again
+    latencies = []
+    start = time.perf_counter()
+    sf.scan_with_callback(root, lambda *content: latencies.append(time.perf_counter() - start))
+    return time.perf_counter() - start, latencies
+
+
+def bench_recover(args):
+    with tempfile.TemporaryDirectory(prefix="swapbench") as root:
+        start = time.perf_counter()
+        corpus = make_corpus(root, args)
+        swaps = [path for paths in corpus.values() for path in paths]
+        size = sum(os.path.getsize(path) for path in swaps)
+        print(f"Created {len(swaps)} swap files ({convert_bytes(size)}; {len(corpus['small'])} small, "
+              f"{len(corpus['large'])} large, {len(corpus['corrupt'])} corrupt) and {args.decoys} decoys "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        load_config(root, workers=args.workers, recover_timeout=args.timeout, max_file_size=args.max_file_size,
+                    vim_fallback=args.vim_fallback, index_path="")
+        sf = VimSwapFileFinder()
+        sf.update_time(datetime.datetime(2000, 1, 1))
+        # Start the workers outside of the measurements
+        list(sf.get_pool().map(abs, range(args.workers)))
+
+        cases = [
+            ("recover_swap_file (preview)", lambda: bench_recover_swap_file(sf, swaps, False)),
+            ("recover_swap_file (full)", lambda: bench_recover_swap_file(sf, swaps, True)),
+            ("scan_directory (preview)", lambda: bench_scan_directory(sf, root, False)),
+            ("scan_directory (keepfile)", lambda: bench_scan_directory(sf, root, True)),
+            ("scan_with_callback", lambda: bench_scan_with_callback(sf, root)),
+        ]
+        print(f"{'case':<30} {'files':>6} {'time':>9} {'files/s':>9} {'p50':>10} {'p95':>10} {'p99':>10} {'peak RSS':>12}")
+        try:
+            for name, func in cases:
+                with RSSSampler() as rss:
+                    elapsed, latencies = func()
+                # Corrupt files that cannot be recovered still count as scanned
+                report(name, len(swaps), elapsed, latencies, rss.peak)
+        finally:
+            sf.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the swap file finder on synthetic directories.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    walk = commands.add_parser("walk", help="list candidates in a large directory")
+    walk.add_argument("--files", type=int, default=100000)
+    walk.add_argument("--swap-ratio", type=float, default=0.01, help="fraction of files that are swap files")
+    walk.add_argument("--subdirs", type=int, default=0, help="spread files over this many subdirectories")
+    walk.add_argument("--depth", type=int, default=0, help="swapfinder.scan_depth to scan with")
+    walk.add_argument("--repeat", type=int, default=5)
+    walk.set_defaults(run=bench_walk)
+
+    recover = commands.add_parser("recover", help="recover a synthetic corpus of swap files")
+    recover.add_argument("--small", type=int, default=500, help="number of small swap files (up to 300 lines)")
+    recover.add_argument("--large", type=int, default=5, help="number of large swap files")
+    recover.add_argument("--large-lines", type=int, default=50000, help="lines in each large swap file")
+    recover.add_argument("--corrupt", type=int, default=30, help="number of damaged swap files")
+    recover.add_argument("--decoys", type=int, default=10000, help="number of files that are not swap files")
+    recover.add_argument("--workers", type=int, default=4, help="swapfinder.workers")
+    recover.add_argument("--timeout", type=float, default=10.0, help="swapfinder.recover_timeout")
+    recover.add_argument("--max-file-size", type=int, default=1024 * 1024 * 64, help="swapfinder.max_file_size")
+    recover.add_argument("--vim-fallback", action="store_true", help="let vim retry files the parser rejects")
+    recover.set_defaults(run=bench_recover)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -1,23 +1,107 @@
+import time
+import_start = time.perf_counter()
+import sys
 import json
-import psutil
+import asyncio
+import argparse
+import importlib
 import discord
 import datetime
+from   contextlib import contextmanager
 import sus.config
 from   sus.config import config_handler
-import sus.idfinder
-import sus.swapfinder
 from   sus.basiclib import *
-import sus.clickup
+from   sus.basiclib import metrics, watchdog
+from   sus.basiclib.outbox import split_message
+import_time = time.perf_counter() - import_start
 
-token = None
+token, cogs = None, None
 
 @config_handler.after_load
 def __load_config():
-    global token
+    global token, cogs
     token =  config_handler.get_configuration("token")
+    cogs =   config_handler.get_configuration("cogs")
+
+class StartupProfile:
+    """Time the phases of startup, and count the modules each one imports."""
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self.phases = [] # (name, seconds, modules imported)
+        self.started = time.perf_counter()
+        self.connect_start = self.started
+
+    @contextmanager
+    def phase(self, name):
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start, len(sys.modules) - modules))
+
+    def add(self, name, seconds, modules = 0):
+        self.phases.append((name, seconds, modules))
+
+    def report(self, title):
+        if not self.enabled:
+            return
+        width = max(len(name) for name, _, _ in self.phases)
+        print(f"Startup profile ({title}, {time.perf_counter() - self.started + import_time:.3f}s since start):")
+        for name, seconds, modules in self.phases:
+            print(f"  {name:<{width}} {seconds * 1000:>9.1f}ms {modules:>5} modules")
+        print("  Run with `python -X importtime` for a per-module breakdown of the imports.")
+
+profile = StartupProfile()
+profile.add("import main (py-cord, sus.config, sus.basiclib)", import_time, len(sys.modules))
 
 bot = discord.Bot()
 start_time = datetime.datetime.now()
+sampler, loop_watchdog = None, None
+config_check, config_watch = None, None
+
+# The only user allowed to run admin commands
+ADMIN_ID = 582151572646133770
+
+def update_watchdog():
+    """Start or stop the event loop watchdog as configured. Must be called from the loop."""
+    global loop_watchdog
+    if loop_watchdog is not None:
+        loop_watchdog.stop()
+        loop_watchdog = None
+    if watchdog.ENABLED:
+        loop_watchdog = watchdog.Watchdog(watchdog.THRESHOLD)
+        loop_watchdog.start()
+        print(f"Watching the event loop for stalls over {watchdog.THRESHOLD}s")
+
+@config_handler.on_change
+def apply_config(changed):
+    if sampler is not None and changed.keys() & {"watchdog.enabled", "watchdog.threshold"}:
+        update_watchdog()
+
+@bot.listen()
+async def on_ready():
+    global sampler, config_check, config_watch
+    # on_ready fires again after every reconnect
+    if sampler is None:
+        profile.add("connect to gateway", time.perf_counter() - profile.connect_start)
+        profile.report("ready")
+        sampler = asyncio.create_task(metrics.run_sampler())
+        update_watchdog()
+    if config_check is None:
+        # Checkers may call remote APIs, do not hold up startup for them
+        config_check = asyncio.create_task(config_handler.check())
+    if config_watch is None and config_handler.path is not None:
+        config_watch = asyncio.create_task(config_handler.watch())
+
+@bot.before_invoke
+async def start_timer(ctx: discord.ApplicationContext):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def stop_timer(ctx: discord.ApplicationContext):
+    # Also called when the command raised
+    metrics.observe("command_seconds", time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name)
 
 def lazy_embed(title, color, section_list = {}, description = None, inline = True):
 
@@ -43,27 +127,121 @@ async def hello(ctx, name: str = None):
     name = name or ctx.author.name
     await ctx.respond(f"Hello {name}!")
 
+# Discord only bulk deletes messages younger than 14 days, up to 100 at a time
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5) # margin for clock skew
+BULK_DELETE_SIZE = 100
+# Seconds between progress updates of the reply
+PROGRESS_INTERVAL = 2.0
+
+class Purge:
+    """
+    Delete messages of a channel: in bulk where Discord allows it, otherwise one by one in a background worker.
+    Failures only skip the message concerned. Single deletions are paced by py-cord's rate limit handling.
+    """
+    def __init__(self, channel):
+        self.channel = channel
+        self.deleted = 0
+        self.failed = 0
+        self.old = asyncio.Queue()
+        self.worker = asyncio.create_task(self.delete_old())
+
+    async def delete_one(self, msg):
+        try:
+            await msg.delete()
+            self.deleted += 1
+        except discord.NotFound:
+            pass # already gone
+        except discord.HTTPException as e:
+            self.failed += 1
+            print(f"{unix_to_datetime(datetime.datetime.now().timestamp())} Upon deleting message {msg.id}, an HTTP exception occured (status {e.status})")
+
+    async def delete_old(self):
+        while (msg := await self.old.get()) is not None:
+            await self.delete_one(msg)
+
+    async def delete_bulk(self, messages):
+        if not hasattr(self.channel, "delete_messages"): # e.g. direct messages
+            for msg in messages:
+                self.old.put_nowait(msg)
+            return
+        try:
+            await self.channel.delete_messages(messages)
+            self.deleted += len(messages)
+        except discord.HTTPException:
+            # A single bad message fails the whole call, retry them one by one
+            for msg in messages:
+                self.old.put_nowait(msg)
+
+    async def finish(self, progress):
+        """Wait for the worker to delete the remaining old messages, calling `progress` regularly."""
+        self.old.put_nowait(None)
+        while not self.worker.done():
+            await asyncio.wait({self.worker}, timeout=PROGRESS_INTERVAL)
+            await progress()
+
 @bot.slash_command()
-async def delete(ctx: discord.ApplicationContext, count: int = 0):
+async def delete(ctx: discord.ApplicationContext, count: int = 0, bulk: bool = True):
     """
-    Delete messages.
+    Delete messages. Set bulk to False to delete them one by one.
     """
-    if ctx.author.id == 582151572646133770:
+    if ctx.author.id == ADMIN_ID:
         reply = await ctx.respond(f"Deleting...", ephemeral=True)
-        deleted = 0
+        purge = Purge(ctx.channel)
+
+        async def progress():
+            try:
+                await reply.edit_original_response(content=f"Deleting... **{purge.deleted}** message(s) so far.")
+            except discord.HTTPException:
+                pass # the next update may get through
+
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        batch = []
+        last_progress = time.monotonic()
         try:
             async for msg in ctx.channel.history(limit=count, before=ctx.message):
-                await msg.delete()
-                deleted += 1
+                if bulk and msg.created_at > cutoff:
+                    batch.append(msg)
+                    if len(batch) == BULK_DELETE_SIZE:
+                        await purge.delete_bulk(batch)
+                        batch = []
+                else:
+                    purge.old.put_nowait(msg)
+                if time.monotonic() - last_progress > PROGRESS_INTERVAL:
+                    await progress()
+                    last_progress = time.monotonic()
+            if batch:
+                await purge.delete_bulk(batch)
         except discord.HTTPException as e:
-            print(f"{unix_to_datetime(datetime.datetime.now().timestamp())} Upon deleting message, an HTTP exception occured (status {e.status})")
+            print(f"{unix_to_datetime(datetime.datetime.now().timestamp())} Upon listing messages to delete, an HTTP exception occured (status {e.status})")
         finally:
-            await reply.edit_original_response(content=f"Deleted **{deleted}** message(s). Shhhh!", delete_after=5.0)
+            await purge.finish(progress)
+            failed = f", failed to delete **{purge.failed}**" if purge.failed else ""
+            await reply.edit_original_response(content=f"Deleted **{purge.deleted}** message(s){failed}. Shhhh!", delete_after=5.0)
     else:
         await ctx.respond(f"You don't have permission to invoke this dangerous command.", ephemeral=True, delete_after=5.0)
 
 @bot.slash_command()
-async def botstat(ctx):
+async def reload_config(ctx: discord.ApplicationContext):
+    """
+    Reload config.json now, without restarting.
+    """
+    if ctx.author.id != ADMIN_ID:
+        await ctx.respond(f"You don't have permission to invoke this dangerous command.", ephemeral=True, delete_after=5.0)
+        return
+    await ctx.defer(ephemeral=True)
+    changed, rejected = await config_handler.reload()
+    msg = f"Changed: {', '.join(f'`{name}`' for name in changed) or 'nothing'}."
+    if rejected:
+        msg += "\nNot reloaded:\n" + "".join(f"- `{name}`: {reason}\n" for name, reason in rejected.items())
+    for part in split_message(msg):
+        await ctx.followup.send(part, ephemeral=True)
+
+@bot.slash_command()
+async def botstat(ctx, timings: bool = True):
+    """
+    Show the bot's resource usage, and the latency percentiles of its commands and tasks (in ms).
+    """
+    import psutil
 
     bot_process = psutil.Process()
     with bot_process.oneshot():
@@ -94,21 +272,47 @@ async def botstat(ctx):
                         "Latency":
                             f"`{bot.latency * 1000:.2f}ms`"
                         })
-    
+    if timings:
+        # Embed field values are limited to 1024 characters,
+        # and embeds to 6000 in total
+        for i, table in enumerate(split_message(metrics.render_table(), 1024 - 8)[:4]):
+            embed.add_field(name="Timings (ms)" if i == 0 else "\u200b", value=f"```\n{table}```", inline=False)
+
     await ctx.respond(embed=embed)
 
 def load_module(module: discord.Cog):
     print(f"Load module {module.__cog_name__}...")
-    bot.add_cog(module(bot))
+    with profile.phase(f"init {module.__cog_name__}"):
+        bot.add_cog(module(bot))
     for c in module.get_commands(module):
         print(f"Registered command {c.name}")
 
+def import_cog(path: str):
+    """Import the cog class at `path`, e.g. `sus.clickup.ClickupCog`. Return None if it cannot be imported."""
+    module_name, _, class_name = path.rpartition(".")
+    try:
+        with profile.phase(f"import {module_name}"):
+            return getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError, ValueError) as e:
+        print(f"Cannot load cog {path}: {e!r}")
+        return None
+
 def main():
-    config_handler.load()
-    load_module(sus.swapfinder.SwapFinderCog)
-    load_module(sus.idfinder.StudentIDCog)
-    load_module(sus.clickup.ClickupCog)
+    parser = argparse.ArgumentParser(description="Run the bot.")
+    parser.add_argument("--profile-startup", action="store_true", help="report how long each startup phase takes")
+    args = parser.parse_args()
+    profile.enabled = args.profile_startup
+
+    with profile.phase("load config"):
+        config_handler.load()
+    # Cogs, and everything only they need, are imported once they are known to be enabled
+    for path in cogs:
+        module = import_cog(path)
+        if module is not None:
+            load_module(module)
+    profile.report("cogs loaded")
     print(f"Running bot on token {token[:5]}...{token[-5:]}")
+    profile.connect_start = time.perf_counter()
     bot.run(token)
 
 if __name__ == '__main__':
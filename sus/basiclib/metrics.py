@@ -0,0 +1,175 @@
+"""
+In-process timing metrics, to see where the time goes and catch regressions under load.
+
+Every metric is a summary of the last `metrics.window` samples: p50, p95 and p99 over that window, and
+the count and sum since startup. `observe`, `timer` and `timed` are safe to call from any thread.
+`run_sampler` measures how late the event loop wakes up, and writes all metrics in the Prometheus
+text format to `metrics.export_path` (unless empty) for node_exporter's textfile collector or a scraper.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from sus.config import config_handler
+
+WINDOW, LAG_INTERVAL, EXPORT_PATH, EXPORT_INTERVAL = None, None, None, None
+
+# Prepended to the names of exported metrics
+EXPORT_PREFIX = "cube_bot_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+@config_handler.after_load
+def __load_config():
+    global WINDOW, LAG_INTERVAL, EXPORT_PATH, EXPORT_INTERVAL
+    WINDOW = config_handler.get_configuration("metrics.window")
+    LAG_INTERVAL = config_handler.get_configuration("metrics.lag_interval")
+    EXPORT_PATH = config_handler.get_configuration("metrics.export_path")
+    EXPORT_INTERVAL = config_handler.get_configuration("metrics.export_interval")
+
+
+def quantiles(samples) -> list[float]:
+    """The `QUANTILES` of `samples`, all 0 if there are none."""
+    samples = list(samples)
+    if len(samples) < 2:
+        return [samples[0] if samples else 0.0] * len(QUANTILES)
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return [cuts[round(q * 100) - 1] for q in QUANTILES]
+
+
+class Summary:
+    def __init__(self, window: int):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+
+# (name, sorted label items) -> Summary
+summaries: dict[tuple[str, tuple], Summary] = {}
+lock = threading.Lock()
+
+
+@config_handler.on_change
+def __resize_windows(changed):
+    if "metrics.window" in changed:
+        with lock:
+            for summary in summaries.values():
+                summary.samples = deque(summary.samples, maxlen=WINDOW)
+
+
+def observe(name: str, value: float, **labels):
+    """Record `value` (seconds, for timers) in the summary `name` with `labels`."""
+    key = (name, tuple(sorted(labels.items())))
+    with lock:
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = Summary(WINDOW)
+        summary.observe(value)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Time the body of a `with` block, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name: str, **labels):
+    """Decorator timing every call of a function or coroutine function."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with timer(name, **labels):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with timer(name, **labels):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> list[tuple[str, dict, list[float], int, float]]:
+    """`(name, labels, quantiles, count, sum)` of every metric, sorted by name and labels."""
+    with lock:
+        items = [(name, labels, list(summary.samples), summary.count, summary.sum)
+                 for (name, labels), summary in sorted(summaries.items())]
+    # Sorting the windows is the expensive part, keep it out of the lock
+    return [(name, dict(labels), quantiles(samples), count, total) for name, labels, samples, count, total in items]
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format, as summaries."""
+    lines = []
+    last_name = None
+    for name, labels, values, count, total in snapshot():
+        name = EXPORT_PREFIX + name
+        if name != last_name:
+            lines.append(f"# TYPE {name} summary")
+            last_name = name
+        for q, value in zip(QUANTILES, values):
+            lines.append(f"{name}{format_labels({**labels, 'quantile': q})} {value:.6f}")
+        lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def render_table() -> str:
+    """All metrics as an aligned text table in milliseconds, for humans."""
+    rows = [(name + format_labels(labels), *(f"{value * 1000:.1f}" for value in values), str(count))
+            for name, labels, values, count, total in snapshot()]
+    header = ("metric", "p50", "p95", "p99", "n")
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join(row[0].ljust(widths[0]) + "".join(cell.rjust(width + 1) for cell, width in zip(row[1:], widths[1:]))
+                     for row in [header] + rows) + "\n"
+
+
+def export(path: str):
+    """Write `render_prometheus` to `path` atomically, so a scraper never reads half a file. Blocking."""
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(temp, path)
+
+
+async def run_sampler():
+    """
+    Forever: record how much later than asked the event loop woke up (`event_loop_lag_seconds`) every
+    `metrics.lag_interval` seconds, and export the metrics every `metrics.export_interval` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    last_export = time.monotonic()
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(LAG_INTERVAL)
+        observe("event_loop_lag_seconds", max(0.0, time.monotonic() - start - LAG_INTERVAL))
+        if EXPORT_PATH and time.monotonic() - last_export >= EXPORT_INTERVAL:
+            last_export = time.monotonic()
+            try:
+                await loop.run_in_executor(None, export, EXPORT_PATH)
+            except OSError as e:
+                print(f"Failed to export metrics to {EXPORT_PATH}: {e}")
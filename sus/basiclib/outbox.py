@@ -0,0 +1,123 @@
+"""
+Queue outgoing messages per channel, shared by all cogs.
+
+Each channel has one worker sending its messages in order. Text messages that pile up while the worker
+waits are coalesced into as few messages as fit under `DISCORD_LIMIT`. Pacing is left to py-cord, which
+holds a route back until Discord's `X-RateLimit-Reset` when `X-RateLimit-Remaining` hits 0 and retries 429s.
+Queues are bounded, so a producer reporting faster than Discord accepts waits in `send` instead of
+buffering without limit, while commands answering interactions are not held up.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import discord
+from collections import namedtuple
+from sus.config import config_handler
+
+# Discord rejects messages over 2000 characters, keep some room to be safe
+DISCORD_LIMIT = 2000 - 10
+
+QUEUE_SIZE = None
+
+
+@config_handler.after_load
+def __load_config():
+    global QUEUE_SIZE
+    QUEUE_SIZE = config_handler.get_configuration("outbox.queue_size")
+
+
+# A queued message; messages with a file are never coalesced
+Outgoing = namedtuple('Outgoing', ['content', 'file', 'options'])
+
+
+def split_message(text: str, limit: int = DISCORD_LIMIT) -> list[str]:
+    """
+    Split `text` into as few messages of at most `limit` characters as possible, at line breaks.
+    Only a single line longer than `limit` is cut in the middle.
+    """
+    messages, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            messages.append(current)
+            current = ""
+        current += line
+    if current:
+        messages.append(current)
+    return messages
+
+
+class Outbox:
+    def __init__(self, channel: discord.abc.Messageable, maxsize: int):
+        self.channel = channel
+        self.queue: asyncio.Queue[Outgoing] = asyncio.Queue(maxsize)
+        self.worker: asyncio.Task | None = None
+        # Taken from the queue but did not fit in the last batch
+        self.held: Outgoing | None = None
+
+    async def send(self, content: str = "", file: discord.File | None = None, **options):
+        r"""
+        Queue a message, waiting only while the queue is full. Failures are logged, not raised.
+
+        :param file: Attached to the last message if `content` has to be split. It is closed once sent.
+        :param options: Passed to `channel.send`, e.g. `suppress`. Only messages with equal options are coalesced.
+        """
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.get_running_loop().create_task(self.run())
+        await self.queue.put(Outgoing(content, file, options))
+
+    async def flush(self):
+        """Wait until everything queued so far is sent."""
+        await self.queue.join()
+
+    async def next_batch(self) -> list[Outgoing]:
+        """Take the next message and the text messages already waiting behind it that fit along."""
+        first = self.held or await self.queue.get()
+        self.held = None
+        batch, size = [first], len(first.content)
+        while first.file is None and not self.queue.empty():
+            message = self.queue.get_nowait()
+            if (message.file is not None or message.options != first.options
+                    or size + 1 + len(message.content) > DISCORD_LIMIT):
+                self.held = message
+                break
+            batch.append(message)
+            size += 1 + len(message.content)
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self.next_batch()
+            content = "\n".join(message.content for message in batch)
+            file = batch[-1].file
+            try:
+                messages = split_message(content) or [None]
+                for i, message in enumerate(messages):
+                    last = i == len(messages) - 1
+                    await self.channel.send(message, file=file if last else None, **batch[0].options)
+            except discord.HTTPException as e:
+                print(f"Cannot send to channel {self.channel.id} (status {e.status}): {e.text}")
+            except Exception as e:
+                # Keep the worker alive, or everything queued behind would wait forever
+                print(f"Cannot send to channel {self.channel.id}: {e!r}")
+            finally:
+                if file is not None:
+                    file.close()
+                for _ in batch:
+                    self.queue.task_done()
+
+
+outboxes: dict[int, Outbox] = {}
+
+
+def outbox_for(channel: discord.abc.Messageable) -> Outbox:
+    """The shared outbox of `channel`."""
+    if channel.id not in outboxes:
+        outboxes[channel.id] = Outbox(channel, QUEUE_SIZE)
+    return outboxes[channel.id]
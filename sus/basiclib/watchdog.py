@@ -0,0 +1,86 @@
+"""
+Detect code blocking the event loop, e.g. blocking I/O or a subprocess run in a coroutine.
+
+A heartbeat task on the loop records when it last ran; a watchdog thread checks it. When the loop has not
+run the heartbeat for `watchdog.threshold` seconds, the thread prints the stack of the loop's thread and the
+task running, which point at the blocking call. Nothing but the heartbeat runs on the loop in the meantime.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import sys
+import threading
+import time
+import traceback
+from sus.basiclib.metrics import observe
+from sus.config import config_handler
+
+ENABLED, THRESHOLD = None, None
+
+
+@config_handler.after_load
+def __load_config():
+    global ENABLED, THRESHOLD
+    ENABLED = config_handler.get_configuration("watchdog.enabled")
+    THRESHOLD = config_handler.get_configuration("watchdog.threshold")
+
+
+class Watchdog:
+    def __init__(self, threshold: float):
+        """Report stalls of the event loop longer than `threshold` seconds, once `start`ed on the loop."""
+        self.threshold: float = threshold
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread: int | None = None
+        self.last_beat: float = time.monotonic()
+        self.heartbeat: asyncio.Task | None = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="watchdog", daemon=True)
+
+    async def beat(self):
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def start(self):
+        """Start watching the running loop. Must be called from the loop."""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.heartbeat = self.loop.create_task(self.beat())
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+
+    def describe(self) -> str:
+        """What the loop's thread is doing right now: the running task and the stack."""
+        frame = sys._current_frames().get(self.loop_thread)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(thread not found)\n"
+        # Looked up without the loop's cooperation, it may be a moment off
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            running = "a callback outside of any task"
+        else:
+            coro = task.get_coro()
+            running = f"task {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        return f"{running}, at:\n{stack}"
+
+    def run(self):
+        stall = None # last_beat before the stall being reported
+        while not self.stopped.wait(self.threshold / 2):
+            last_beat = self.last_beat
+            if stall is not None and last_beat != stall:
+                # The heartbeat is late by at most a sleep even without a stall
+                blocked = last_beat - stall - self.threshold / 4
+                observe("event_loop_stall_seconds", blocked)
+                print(f"{datetime.datetime.now():%b %d %H:%M:%S} Event loop unblocked after about {blocked:.2f}s", flush=True)
+                stall = None
+            late = time.monotonic() - last_beat - self.threshold / 4
+            if stall is None and late > self.threshold:
+                stall = last_beat
+                print(f"{datetime.datetime.now():%b %d %H:%M:%S} Event loop blocked for {late:.2f}s by {self.describe()}",
+                      end="", flush=True)
@@ -1,7 +1,11 @@
 """Integration with ClickUp."""
 
 from sus.clickup.abstract import *
+from sus.clickup.cache import ClickupCache
+from sus.clickup.client import close_session
 from sus.basiclib import unix_to_datetime, unix_to_time
+from sus.basiclib.metrics import timed
+from sus.basiclib.outbox import outbox_for, split_message
 from discord.ext import tasks, commands
 import asyncio
 import datetime
@@ -18,7 +22,6 @@ T_MEETING = "meeting"
 
 NUM_TRUNC = 15
 SUBTASK_EXPAND = 3
-DISCORD_LIMIT = 2000 - 10
 
 
 @config_handler.after_load
@@ -38,7 +41,7 @@ class ClickupCog(commands.Cog):
         self.prober.start()
         self.next_reminder: datetime.datetime = self.next_morning(
             datetime.datetime.now())
-        self.data = ClickupData(True)
+        self.cache = ClickupCache(ClickupData(max_child=SUBTASK_EXPAND))
 
     @classmethod
     def next_morning(cls, t: datetime.datetime):
@@ -50,9 +53,14 @@ class ClickupCog(commands.Cog):
 
     def cog_unload(self):
         self.prober.cancel()
+        self.bot.loop.create_task(close_session())
 
     @classmethod
-    def stringify_tasks(cls, task_list: list[ClickupTask], header: str, trunc: int = -1) -> list[str]:
+    def stringify_tasks(cls, task_list: list[ClickupTask], header: str, trunc: int = -1, total: int | None = None) -> list[str]:
+        """
+        Format tasks as message lines under `header`.
+        `total` is the number of tasks before the caller truncated `task_list`, if it did.
+        """
 
         def get_timedelta(due_time: float):
             delta = datetime.datetime.fromtimestamp(
@@ -111,8 +119,9 @@ class ClickupCog(commands.Cog):
             name = task.name if task.parent_task is None else f"[{task.parent_task.name}] {task.name}"
             msg.append(f"- :{emoji}: {due}: {link} {name}\n")
 
-        if trunc != -1 and len(msg) > trunc:
-            remain = len(msg) - trunc
+        total = len(msg) if total is None else total
+        if trunc != -1 and total > trunc:
+            remain = total - trunc
             del msg[trunc:]
             msg.append(f"... and **{remain}** more task(s)\n")
 
@@ -121,60 +130,36 @@ class ClickupCog(commands.Cog):
 
         return msg
 
-    def parse_tasks(self, truncate: int = NUM_TRUNC) -> list[str]:
-        self.data.update()
-        tasks = self.data.get_expanded_tasks(max_child=SUBTASK_EXPAND)
-
-        tasks.sort(key=lambda x: (0 if x.due_date else 1, x.due_date))
+    @timed("clickup_parse_tasks_seconds")
+    async def parse_tasks(self, truncate: int = NUM_TRUNC, force: bool = False) -> list[str]:
+        data = await self.cache.get(force)
+        index = data.index
 
         # Custom logic of categorize tasks
-        course: list[ClickupTask] = []
-        in_progress: list[ClickupTask] = []
-
-        for task in tasks:
-            if T_COURSE in task.tags:
-                if datetime.datetime.fromtimestamp(task.due_date).day != datetime.datetime.now().day:
-                    continue
-                course.append(task)
-            elif task.status.type == "open" or task.status.type == "custom":
-                in_progress.append(task)
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        course = index.with_tag(T_COURSE).between(today.timestamp(),
+                                                  (today + datetime.timedelta(days=1)).timestamp())
+        in_progress, total = index.with_status(["open", "custom"], exclude_tag=T_COURSE, limit=truncate)
 
         msg = (self.stringify_tasks(course, header="## :teacher: Today's Schedule\n") +
-               self.stringify_tasks(in_progress, header="## :chart_with_upwards_trend: In Progress\n", trunc=truncate))
+               self.stringify_tasks(in_progress, header="## :chart_with_upwards_trend: In Progress\n", trunc=truncate, total=total))
 
         if len(msg) == 0:
             msg = ["## :face_with_monocle: :partying_face No tasks? No way!\n"]
 
         return msg
 
-    async def async_parse_tasks(self, truncate: int = NUM_TRUNC) -> list[str]:
-        """
-        Async wrapper for parse_tasks.
-        """
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, self.parse_tasks, truncate)
-        return result
-
     @commands.slash_command()
-    async def list_tasks(self, ctx: discord.ApplicationContext, truncate: int = NUM_TRUNC):
+    async def list_tasks(self, ctx: discord.ApplicationContext, truncate: int = NUM_TRUNC, force: bool = False):
         """
-        List all tasks from a user.
+        List all tasks from a user. Set force to skip the cache and wait for fresh data.
         """
         await ctx.defer()
-        task_msg = await self.async_parse_tasks(truncate=truncate)
-
-        current_msg = ""
-        for i in range(len(task_msg)):
-            # Just to be safe
-
-            if len(current_msg) + len(task_msg[i]) > DISCORD_LIMIT:
-                await ctx.followup.send(current_msg)
-                current_msg = ""
-
-            current_msg += task_msg[i]
+        task_msg = await self.parse_tasks(truncate=truncate, force=force)
 
-        if current_msg != "":
-            await ctx.followup.send(current_msg)
+        # Follow-ups answer the interaction, they do not go through the channel's outbox
+        for msg in split_message("".join(task_msg)):
+            await ctx.followup.send(msg)
 
     @tasks.loop(hours=23.9)
     async def prober(self):
@@ -184,19 +169,8 @@ class ClickupCog(commands.Cog):
         user = await self.bot.fetch_user(MENTION_ID)
 
         task_msg = [f"{user.mention}\n",
-                    f"# Daily Reminder {datetime.datetime.now().strftime('%b %d')}\n"] + (await self.async_parse_tasks())
-        current_msg = ""
-        for i in range(len(task_msg)):
-            # Just to be safe
-
-            if len(current_msg) + len(task_msg[i]) > DISCORD_LIMIT:
-                await channel.send(current_msg, suppress=True)
-                current_msg = ""
-
-            current_msg += task_msg[i]
-
-        if current_msg != "":
-            await channel.send(current_msg, suppress=True)
+                    f"# Daily Reminder {datetime.datetime.now().strftime('%b %d')}\n"] + (await self.parse_tasks(force=True))
+        await outbox_for(channel).send("".join(task_msg), suppress=True)
 
         self.next_reminder = self.next_morning(self.next_reminder)
 
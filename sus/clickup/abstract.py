@@ -1,183 +1,398 @@
 from __future__ import annotations
 
-import json
-import requests
+import asyncio
 import os
+import sys
+import time
+from collections.abc import AsyncIterator
 from sus.config import config_handler
+from sus.clickup.client import call_method
+from sus.clickup.index import ClickupTaskIndex
 
-API_ENDPOINT = "https://api.clickup.com/api/v2/"
-API_TOKEN = None
+FULL_SYNC_INTERVAL, PAGE_PREFETCH = None, None
 
-# TODO: handle deletion of all objects
-# It is not very useful under the context of this bot, but it is nice to have it for completeness
+# Tasks per page of the "Get Tasks" API
+PAGE_SIZE = 100
+
+# Seconds an incremental sync reaches back before the last one, for clock skew with ClickUp and tasks
+# updated while the last sync was running. Re-merging a task that did not change is harmless.
+SYNC_OVERLAP = 60
+
+# Teams, spaces and lists are re-listed on every refresh, so deleted ones disappear then.
+# Deleted tasks never show up in an incremental sync; they are dropped by the periodic full sync.
 
 
 @config_handler.after_load
 def __load_config():
-    global API_TOKEN
-    API_TOKEN = config_handler.get_configuration("clickup.token")
+    global FULL_SYNC_INTERVAL, PAGE_PREFETCH
+    FULL_SYNC_INTERVAL = config_handler.get_configuration("clickup.full_sync_interval")
+    PAGE_PREFETCH = config_handler.get_configuration("clickup.page_prefetch")
+
+
+def reconcile(objects: list, data: list[dict], factory) -> list:
+    """
+    Match freshly listed `data` against existing `objects` by id.
+    Existing objects are kept (with their synced state) and renamed; new ones are built by `factory`.
+    Objects missing from `data` are dropped.
+    """
+    existing = {obj.id: obj for obj in objects}
+    result = []
+    for ele in data:
+        obj = existing.get(int(ele["id"]))
+        if obj is None:
+            obj = factory(ele)
+        else:
+            obj.name = ele["name"]
+        result.append(obj)
+    return result
+
+
+async def update_isolated(objects: list, full: bool):
+    """
+    Update `objects` concurrently.
+    A failure is reported and leaves that object's previously synced data in place, without affecting its siblings.
+    """
+    results = await asyncio.gather(*(obj.update(full) for obj in objects), return_exceptions=True)
+    for obj, result in zip(objects, results):
+        if isinstance(result, Exception):
+            print(f"Failed to update {type(obj).__name__} {obj.name} ({obj.id}): {type(result).__name__} {result}")
+
+
+# Every distinct tag combination is stored once and shared by all tasks carrying it
+_tag_sets: dict[frozenset[str], frozenset[str]] = {}
+
 
+def intern_tags(names) -> frozenset[str]:
+    tags = frozenset(sys.intern(name) for name in names)
+    return _tag_sets.setdefault(tags, tags)
 
-def call_method(method: str, params: dict = {}):
-    r = requests.get(os.path.join(API_ENDPOINT, method),
-                     params=params, headers={"Authorization": API_TOKEN})
-    if not r.ok:
-        r.raise_for_status()
-    return r
+
+def status_key(data) -> str:
+    # Older payloads may lack the status id, the name is unique within a list anyway
+    return data.get("id") or data["status"]
 
 
 class ClickupTaskStatus:
+    __slots__ = ("id", "name", "type", "orderindex", "color")
+
     def __init__(self, data):
-        self.id: str = data["id"]
+        self.set(data)
+
+    def set(self, data):
+        self.id: str = status_key(data)
         self.name: str = data["status"]
-        self.type: str = data["type"]
+        self.type: str = sys.intern(data["type"])
         self.orderindex: int = int(data["orderindex"])
         self.color: str = data["color"]
 
 
 class ClickupTask:
-    def __init__(self, data):
+    # Hot fields are converted up front; cold ones keep their raw JSON value until first accessed
+    __slots__ = ("id", "name", "tags", "status", "assignees", "date_updated", "due_date",
+                 "parent", "parent_task", "subtask", "_text_content", "_date_created", "_url")
+
+    def __init__(self, data, statuses: dict[str, ClickupTaskStatus] | None = None):
+        r"""
+        Build a task from its JSON `data`.
+
+        :param statuses: Statuses of the task's list by id. The task shares the matching status object
+                         instead of building its own; unknown statuses are added to it.
+        """
         self.id: str = data["id"]
         self.name: str = data["name"]
-        self.tags: list[str] = [tag["name"] for tag in data["tags"]]
-        self.text_content: str = data["text_content"]
-        self.status: ClickupTaskStatus = ClickupTaskStatus(data["status"])
+        self.tags: frozenset[str] = intern_tags(tag["name"] for tag in data["tags"])
+        if statuses is None:
+            self.status: ClickupTaskStatus = ClickupTaskStatus(data["status"])
+        else:
+            key = status_key(data["status"])
+            if key not in statuses:
+                statuses[key] = ClickupTaskStatus(data["status"])
+            self.status: ClickupTaskStatus = statuses[key]
+        self.assignees: tuple[int, ...] = tuple(user["id"] for user in data.get("assignees", []))
 
         # We all divide by 1000 to match with Python's UNIX time format
-        self.date_created: float = int(data["date_created"]) / 1000
         self.date_updated: float = int(data["date_updated"]) / 1000
         self.due_date: float | None = int(data["due_date"]) / 1000 if data["due_date"] else None
 
-        self.parent: int | None = data["parent"]
+        self.parent: str | None = data["parent"]
         self.parent_task: ClickupTask | None = None
-        self.url: str = data["url"]
         # self.list: ClickupList = ClickupList(data["list"], , defer=True)
         self.subtask: list[ClickupTask] = []
 
+        self._text_content: str | None = data["text_content"]
+        self._date_created: str = data["date_created"]
+        self._url: str = data["url"]
+
+    @property
+    def text_content(self) -> str:
+        return self._text_content or ""
+
+    @property
+    def date_created(self) -> float:
+        return int(self._date_created) / 1000
+
+    @property
+    def url(self) -> str:
+        return self._url
+
     def add_child(self, task: ClickupTask):
         self.subtask.append(task)
 
+    def remove_child(self, task: ClickupTask):
+        try:
+            self.subtask.remove(task)
+        except ValueError:
+            pass
+
 
 class ClickupList:
-    def __init__(self, data, user_id, defer=False):
+    def __init__(self, data, user_id):
         self.id: int = int(data["id"])
         self.user_id: int = user_id
         self.name: str = data["name"]
         self.tasks: list[ClickupTask] = []
         self.expanded_tasks: list[ClickupTask] = []
         self.status_list: list[ClickupTaskStatus] = []
-        if not defer:
-            self.update()
+        # Interned statuses by id, shared by all tasks of this list
+        self.statuses: dict[str, ClickupTaskStatus] = {}
+
+        # Synced state, kept between updates for incremental syncs
+        self.task_map: dict[str, ClickupTask] = {}
+        self.last_sync: float | None = None
+        self.last_full_sync: float | None = None
 
-    def update(self):
-        list_data = call_method(os.path.join("list", str(self.id))).json()
+    def intern_status(self, data) -> ClickupTaskStatus:
+        """
+        Get the shared status object for `data`.
+        An existing one is updated in place, so a renamed or recolored status applies to every task at once.
+        """
+        key = status_key(data)
+        if key in self.statuses:
+            self.statuses[key].set(data)
+        else:
+            self.statuses[key] = ClickupTaskStatus(data)
+        return self.statuses[key]
+
+    def is_tracked(self, task: ClickupTask) -> bool:
+        """Whether `task` belongs in this list's view: still open and assigned to the user."""
+        return task.status.type not in ["done", "closed"] and self.user_id in task.assignees
+
+    async def _iter_task_pages(self, params: dict) -> AsyncIterator[list[ClickupTask]]:
+        """
+        Yield pages of tasks in the order they arrive.
+        Page 0 is requested alone; only if it is full and not the last page are up to `clickup.page_prefetch`
+        pages requested ahead, until a page reports `last_page`.
+        """
+        method = os.path.join("list", str(self.id), "task")
+
+        def fetch(page: int) -> asyncio.Task:
+            return asyncio.create_task(call_method(method, {"page": page,
+                                                            "order_by": "due_date",
+                                                            "subtasks": True} | params))
+
+        pending = {fetch(0): 0}
+        next_page = 1
+        last_page: int | None = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for request, page in sorted(((request, pending.pop(request)) for request in done),
+                                            key=lambda ele: ele[1]):
+                    # Pages past the end are not needed, whether they arrived or failed
+                    if last_page is not None and page > last_page:
+                        continue
+                    task_data = request.result()
+                    if task_data["last_page"] or not task_data["tasks"]:
+                        last_page = page
+                        for other in [other for other, p in pending.items() if p > last_page]:
+                            other.cancel()
+                            del pending[other]
+                    elif last_page is None:
+                        # Most lists fit in one page, only prefetch for those that fill it
+                        window = PAGE_PREFETCH if page == 0 and len(task_data["tasks"]) >= PAGE_SIZE else 1
+                        for _ in range(window):
+                            pending[fetch(next_page)] = next_page
+                            next_page += 1
+                    yield [ClickupTask(ele, self.statuses) for ele in task_data["tasks"]]
+        finally:
+            for request in pending:
+                request.cancel()
+
+    def _link(self, task: ClickupTask):
+        if task.parent:
+            try:
+                task.parent_task = self.task_map[task.parent]
+                task.parent_task.add_child(task)
+            except KeyError:
+                print(f"Task {task} has unaccessible parent {task.parent}")
+                pass
+
+    def _unlink(self, task: ClickupTask):
+        if task.parent_task is not None:
+            task.parent_task.remove_child(task)
+            task.parent_task = None
+
+    def merge(self, fetched: list[ClickupTask]):
+        """
+        Merge tasks changed since the last sync into `task_map`.
+        Only the changed tasks (and the children of replaced ones) are re-linked.
+        """
+        changed: list[ClickupTask] = []
+        added: set[str] = set()
+        for task in fetched:
+            old = self.task_map.pop(task.id, None)
+            if old is not None:
+                self._unlink(old)
+                # Children keep pointing at the task, not at this particular copy of it
+                task.subtask = old.subtask
+                for child in task.subtask:
+                    child.parent_task = task if self.is_tracked(task) else None
+            if not self.is_tracked(task):
+                continue
+            if old is None:
+                added.add(task.id)
+            self.task_map[task.id] = task
+            changed.append(task)
+
+        for task in changed:
+            self._link(task)
+
+        # Subtasks may have synced before their parent became visible to us
+        if added:
+            for task in self.task_map.values():
+                if task.parent in added and task.parent_task is None:
+                    self._link(task)
+
+    def rebuild(self, task_map: dict[str, ClickupTask]):
+        """Replace `task_map` with a fully fetched one."""
+        self.task_map = task_map
+        for task in task_map.values():
+            self._link(task)
+
+    async def update(self, full: bool = False):
+        r"""
+        Sync tasks of this list.
+
+        :param full: Refetch every open task instead of only those updated since the last sync.
+                     A full sync also happens on the first update and every `clickup.full_sync_interval` seconds.
+        """
+        start = time.time()
+        list_data = await call_method(os.path.join("list", str(self.id)))
         self.name = list_data["name"]
-        self.status_list = [ClickupTaskStatus(status) for status in list_data["statuses"]]
-
-        # It is better to reconstruct all tasks at this point, since tasks tend to come in large numbers
-        # Using the API call we can save many calls (as internet is probably the bottleneck)
-        self.expanded_tasks = []
-        page = 0
-        while True:
-            task_data = (call_method(os.path.join("list", str(self.id), "task"),
-                                     {"page": page, 
-                                      "order_by": "due_date", 
-                                      "subtasks": True,
-                                      "assignees": [self.user_id, self.user_id], # force it to be an array
-                                      "statuses": [status.name for status in self.status_list if status.type not in ["done", "closed"]]})
-                         .json())
-            self.expanded_tasks += [ClickupTask(ele) for ele in task_data["tasks"]]
-            if task_data["last_page"]:
-                break
+        self.status_list = [self.intern_status(status) for status in list_data["statuses"]]
+
+        if self.last_full_sync is None or start - self.last_full_sync >= FULL_SYNC_INTERVAL:
+            full = True
+
+        if full:
+            # It is better to reconstruct all tasks at this point, since tasks tend to come in large numbers
+            # Using the API call we can save many calls (as internet is probably the bottleneck)
+            # Pages are collected into a new map, which only replaces the old one once every page has arrived
+            task_map = {}
+            async for page in self._iter_task_pages(
+                    {"assignees": [self.user_id, self.user_id], # force it to be an array
+                     "statuses": [status.name for status in self.status_list if status.type not in ["done", "closed"]]}):
+                task_map.update((task.id, task) for task in page)
+            self.rebuild(task_map)
+            self.last_full_sync = start
+        else:
+            # Closed and unassigned tasks are fetched as well, so they can be dropped from the map.
+            # Merging is idempotent, so pages merged before a failure are simply fetched again next time.
+            async for page in self._iter_task_pages(
+                    {"date_updated_gt": int((self.last_sync - SYNC_OVERLAP) * 1000),
+                     "include_closed": True}):
+                self.merge(page)
+        self.last_sync = start
+        self.refresh_views()
+
+    def refresh_views(self):
+        """Rebuild `tasks` and `expanded_tasks` from `task_map`."""
+        self.expanded_tasks = list(self.task_map.values())
         self.tasks = [task for task in self.expanded_tasks if task.parent is None]
-        task_map = {task.id: task for task in self.expanded_tasks}
-        for task in self.expanded_tasks:
-            if task.parent:
-                try:
-                    task.parent_task = task_map[task.parent]
-                    task.parent_task.add_child(task)
-                except KeyError:
-                    print(f"Task {task} has unaccessible parent {task.parent}")
-                    pass
 
 
 class ClickupSpace:
-    def __init__(self, data, user_id, defer=False):
+    def __init__(self, data, user_id):
         self.id: int = int(data["id"])
         self.name: str = data["name"]
         self.user_id: int = user_id
         self.lists: list[ClickupList] = []
 
-        if not defer:
-            self.update()
-
     def __eq__(self, rhs: ClickupSpace):
         assert isinstance(rhs, ClickupSpace)
         return self.id == rhs.id
 
-    def update(self):
-        list_data = call_method(os.path.join("space", str(self.id), "list")).json()
+    async def update(self, full: bool = False):
+        list_data = await call_method(os.path.join("space", str(self.id), "list"))
 
-        self.lists: list[ClickupList] = [ClickupList(ele, self.user_id, True) for ele in list_data["lists"]]
-        
-        for list in self.lists:
-            list.update()
+        self.lists: list[ClickupList] = reconcile(self.lists, list_data["lists"],
+                                                  lambda ele: ClickupList(ele, self.user_id))
+
+        await update_isolated(self.lists, full)
 
 
 class ClickupTeam:
-    def __init__(self, data, user_id, defer=False):
+    def __init__(self, data, user_id):
         """
         Initialize a ClickUp team with the data.
         `data` must contain the field id and name.
-
-        @params defer: Whether the data fetching is deferred.
+        Nothing is fetched until `update` is awaited.
         """
         self.id: int = int(data["id"])
         self.name: str = data["name"]
         self.user_id: int = user_id
         self.spaces: list[ClickupSpace] = []
-        if not defer:
-            self.update()
 
     def __eq__(self, rhs: ClickupTeam):
         assert isinstance(rhs, ClickupTeam)
         return self.id == rhs.id
 
-    def update(self):
-        space_data = call_method(os.path.join("team", str(self.id), "space")).json()
-        self.spaces = [ClickupSpace(ele, self.user_id, True) for ele in space_data["spaces"]]
+    async def update(self, full: bool = False):
+        space_data = await call_method(os.path.join("team", str(self.id), "space"))
+        self.spaces = reconcile(self.spaces, space_data["spaces"],
+                                lambda ele: ClickupSpace(ele, self.user_id))
 
-        for space in self.spaces:
-            space.update()
+        await update_isolated(self.spaces, full)
 
 
 class ClickupData:
-    def __init__(self, defer=False):
+    def __init__(self, max_child: int = 3):
         """
         Initialize all ClickUp data with the token.
+        Nothing is fetched until `update` is awaited.
 
-        @params defer: Whether the data fetching is deferred.
+        @params max_child: Number of subtasks per task included in `index`.
         """
         self.teams: list[ClickupTeam] = []
         self.user_id: int
-        if not defer:
-            self.update()
+        self.max_child: int = max_child
+        self.index: ClickupTaskIndex = ClickupTaskIndex()
 
     def get_tasks(self) -> list[ClickupTask]:
         return [task for team in self.teams for space in team.spaces for list in space.lists for task in list.tasks]
 
     def get_expanded_tasks(self, max_child: int) -> list[ClickupTask]:
-        return sum([[task] + task.subtask[:max_child]
-                    for team in self.teams
-                    for space in team.spaces
-                    for list in space.lists
-                    for task in list.tasks],
-                   [])
-
-    def update(self):
-        user_data = call_method("user").json()
+        expanded = []
+        for task in self.get_tasks():
+            expanded.append(task)
+            expanded += task.subtask[:max_child]
+        return expanded
+
+    async def update(self, full: bool = False):
+        r"""
+        Refresh the whole hierarchy.
+
+        :param full: Force every list to refetch all of its tasks. Otherwise lists only fetch
+                     tasks updated since their last sync, see `ClickupList.update`.
+        """
+        # Siblings are fetched concurrently, so a refresh takes about as long as the deepest
+        # chain of requests; `call_method` keeps the total in flight under the configured cap.
+        user_data, team_data = await asyncio.gather(call_method("user"), call_method("team"))
         self.user_id = user_data["user"]["id"]
-        team_data = call_method("team").json()
-        self.teams = [ClickupTeam(ele, self.user_id, True) for ele in team_data["teams"]]
-        for team in self.teams:
-            team.update()
+        self.teams = reconcile(self.teams, team_data["teams"],
+                               lambda ele: ClickupTeam(ele, self.user_id))
+        await update_isolated(self.teams, full)
+        self.reindex()
+
+    def reindex(self):
+        self.index = ClickupTaskIndex(self.get_expanded_tasks(self.max_child))
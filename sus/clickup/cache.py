@@ -0,0 +1,118 @@
+"""In-memory cache of ClickUp data with stale-while-revalidate refreshes."""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+from sus.config import config_handler
+from sus.clickup.abstract import ClickupData
+from sus.clickup.snapshot import ClickupSnapshot, collect, dump_rows
+
+CACHE_TTL, SNAPSHOT_PATH = None, None
+
+
+@config_handler.after_load
+def __load_config():
+    global CACHE_TTL, SNAPSHOT_PATH
+    CACHE_TTL = config_handler.get_configuration("clickup.cache_ttl")
+    SNAPSHOT_PATH = config_handler.get_configuration("clickup.snapshot_path")
+
+
+class ClickupCache:
+    def __init__(self, data: ClickupData | None = None):
+        """
+        Wrap `data` (a new empty `ClickupData` by default) with a freshness window of `clickup.cache_ttl` seconds.
+        `hits`, `stale_hits` and `misses` count how `get` was served, for tuning the window.
+
+        Unless `clickup.snapshot_path` is empty, every refresh is saved there, and the first `get`
+        after a restart serves the saved data while an incremental sync catches up.
+        """
+        self.data: ClickupData = data or ClickupData()
+        self.last_refresh: float | None = None
+        self.hits: int = 0
+        self.stale_hits: int = 0
+        self.misses: int = 0
+        self._refresh_task: asyncio.Task | None = None
+
+        self.snapshot: ClickupSnapshot | None = ClickupSnapshot(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+        self._restore_task: asyncio.Task | None = None
+        self._save_task: asyncio.Task | None = None
+        self._save_lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return self.last_refresh is not None and time.time() - self.last_refresh < CACHE_TTL
+
+    async def _refresh(self):
+        start = time.time()
+        await self.data.update()
+        self.last_refresh = start
+        if self.snapshot is not None:
+            self._save_task = asyncio.create_task(self.save(start))
+
+    async def save(self, synced_at: float):
+        """Write the current data to the snapshot, off the event loop."""
+        collected = collect(self.data, synced_at)
+        async with self._save_lock:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, *collected)
+            except sqlite3.Error as e:
+                print(f"Failed to save ClickUp snapshot to {self.snapshot.path}: {e}")
+
+    def _write(self, rows: dict[str, list[tuple]], tasks: list):
+        self.snapshot.write(dump_rows(rows, tasks))
+
+    async def _restore(self):
+        try:
+            restored = await asyncio.get_running_loop().run_in_executor(None, self.snapshot.read, self.data.max_child)
+        except (sqlite3.Error, KeyError, ValueError) as e:
+            print(f"Failed to load ClickUp snapshot from {self.snapshot.path}: {e}")
+            return
+        # A refresh may have finished while the snapshot was loading; it is newer, keep it
+        if restored is not None and self.last_refresh is None:
+            self.data, self.last_refresh = restored
+
+    async def restore(self):
+        """Load the snapshot once, if there is one and nothing has been synced yet."""
+        if self.snapshot is None:
+            return
+        if self._restore_task is None:
+            self._restore_task = asyncio.create_task(self._restore())
+        await asyncio.shield(self._restore_task)
+
+    def refresh(self) -> asyncio.Task:
+        """
+        Start refreshing the data, or return the refresh already in progress.
+        Concurrent callers share a single refresh.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._report_failure)
+        return self._refresh_task
+
+    @staticmethod
+    def _report_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"ClickUp refresh failed: {task.exception()!r}")
+
+    async def get(self, force: bool = False) -> ClickupData:
+        r"""
+        Get the cached data.
+
+        :param force: Always wait for a refresh before returning.
+
+        Fresh data is returned right away. Stale data is also returned right away, while a refresh
+        runs in the background. Only missing data (or `force`) makes the caller wait.
+        """
+        if self.last_refresh is None:
+            await self.restore()
+
+        if force or self.last_refresh is None:
+            self.misses += 1
+            await asyncio.shield(self.refresh())
+        elif self.is_fresh():
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+            self.refresh()
+        return self.data
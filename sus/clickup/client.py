@@ -0,0 +1,220 @@
+"""Asynchronous HTTP client for the ClickUp API."""
+
+from __future__ import annotations
+
+import aiohttp
+import asyncio
+import os
+import random
+import re
+import time
+from sus.basiclib.metrics import timer
+from sus.config import config_handler
+
+API_ENDPOINT, API_TOKEN, TIMEOUT, MAX_CONCURRENCY, MAX_RETRIES = None, None, None, None, None
+
+# Seconds an idle connection is kept in the pool for reuse
+KEEPALIVE_TIMEOUT = 60
+# Backoff between retries is drawn from [0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)]
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+# Below this many remaining calls, the rest of the budget is spread evenly until the reset
+PACING_THRESHOLD = 10
+
+
+@config_handler.after_load
+def __load_config():
+    global API_ENDPOINT, API_TOKEN, TIMEOUT, MAX_CONCURRENCY, MAX_RETRIES
+    API_ENDPOINT = config_handler.get_configuration("clickup.api_endpoint")
+    API_TOKEN = config_handler.get_configuration("clickup.token")
+    TIMEOUT = config_handler.get_configuration("clickup.timeout")
+    MAX_CONCURRENCY = config_handler.get_configuration("clickup.max_concurrency")
+    MAX_RETRIES = config_handler.get_configuration("clickup.max_retries")
+
+
+class RateLimiter:
+    """
+    Pace outgoing calls using ClickUp's `X-RateLimit-Remaining` and `X-RateLimit-Reset` headers.
+    Nothing is delayed until the server has reported a budget.
+    """
+
+    def __init__(self):
+        self.remaining: int | None = None
+        self.reset: float | None = None
+        self.lock = asyncio.Lock()
+
+    def observe(self, headers):
+        """Record the budget reported in response `headers`."""
+        try:
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            self.reset = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            pass
+
+    def exhaust(self, headers):
+        """Record a 429: the budget is gone until the reset reported in `headers`."""
+        self.observe(headers)
+        self.remaining = 0
+        if self.reset is None or self.reset <= time.time():
+            self.reset = time.time() + BACKOFF_CAP
+
+    def delay(self) -> float:
+        """Seconds the next call should wait before it is sent."""
+        if self.remaining is None or self.reset is None:
+            return 0
+        window = self.reset - time.time()
+        if window <= 0:
+            # The budget has been refilled, but we do not know by how much until the next response
+            self.remaining, self.reset = None, None
+            return 0
+        if self.remaining <= 0:
+            return window
+        if self.remaining < PACING_THRESHOLD:
+            return window / self.remaining
+        return 0
+
+    async def acquire(self):
+        async with self.lock:
+            await asyncio.sleep(self.delay())
+            # Count calls still in flight against the budget before their responses come back
+            if self.remaining is not None:
+                self.remaining -= 1
+
+
+# One pooled session per bot process. It is bound to the loop it was created in,
+# so a new loop (e.g. a fresh `asyncio.run`) gets a new session.
+_session: aiohttp.ClientSession | None = None
+_session_loop: asyncio.AbstractEventLoop | None = None
+# Caps the number of requests in flight, shared by every concurrent refresh
+_limiter: asyncio.Semaphore | None = None
+_rate_limiter: RateLimiter | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Get the shared ClickUp session, creating it on first use.
+    Must be called from a coroutine running in the bot's event loop.
+    """
+    global _session, _session_loop, _limiter, _rate_limiter
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # The budget outlives a session replaced for a new concurrency, as long as the loop is the same
+        if _rate_limiter is None or _session_loop is not loop:
+            _rate_limiter = RateLimiter()
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_CONCURRENCY, keepalive_timeout=KEEPALIVE_TIMEOUT))
+        _session_loop = loop
+        _limiter = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _session
+
+
+def get_limiter() -> asyncio.Semaphore:
+    """The semaphore capping the calls in flight on the current session."""
+    get_session()
+    return _limiter
+
+
+# Old sessions waiting for their calls to finish before they are closed, see `__apply_config`
+_closing: set[asyncio.Task] = set()
+
+
+async def _close_when_idle(session: aiohttp.ClientSession, limiter: asyncio.Semaphore, size: int):
+    """Close `session` once every call holding one of the `size` permits of its `limiter` is done."""
+    for _ in range(size):
+        await limiter.acquire()
+    await session.close()
+
+
+@config_handler.on_change
+def __apply_config(changed):
+    """
+    Apply a new `clickup.max_concurrency` at once: calls from now on use a new session and limiter,
+    and the old session is closed in the background once the calls holding its limiter are done.
+    Those may be waiting out the rate limit, so the reload does not wait for them.
+    """
+    global _session
+    if "clickup.max_concurrency" not in changed or _session is None or _session.closed:
+        return
+    old_size = changed["clickup.max_concurrency"][0]
+    old_session, old_limiter = _session, _limiter
+    _session = None
+    get_session()
+    task = asyncio.create_task(_close_when_idle(old_session, old_limiter, old_size))
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+async def close_session():
+    """Close the shared session and release its pooled connections."""
+    global _session, _session_loop, _limiter, _rate_limiter
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session, _session_loop, _limiter, _rate_limiter = None, None, None, None
+
+
+def encode_params(params: dict) -> list[tuple[str, str]]:
+    """
+    Flatten `params` into query pairs.
+    Lists become repeated keys and booleans become `true`/`false`, as ClickUp expects.
+    """
+    pairs = []
+    for key, value in params.items():
+        for ele in (value if isinstance(value, (list, tuple)) else [value]):
+            if isinstance(ele, bool):
+                ele = "true" if ele else "false"
+            pairs.append((key, str(ele)))
+    return pairs
+
+
+def is_retryable(e: Exception) -> bool:
+    """Whether a failed call is worth retrying: 429, 5xx, timeouts and dropped connections."""
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+async def call_method(method: str, params: dict = {}, timeout: float | None = None) -> dict:
+    r"""
+    Call a ClickUp API method and return the decoded JSON body.
+
+    :param method: Path of the method relative to `API_ENDPOINT`, e.g. `team`.
+    :param params: Query parameters.
+    :param timeout: Total seconds allowed for each attempt. Defaults to `clickup.timeout`.
+
+    At most `clickup.max_concurrency` calls are in flight at once; the rest wait their turn,
+    so callers are free to `asyncio.gather` as many calls as they like.
+    Calls are paced to stay within ClickUp's rate limit, and 429, 5xx and connection failures
+    are retried up to `clickup.max_retries` times with jittered exponential backoff.
+    The time of each call, retries included, is recorded per endpoint in `clickup_call_seconds`.
+    """
+    # Ids would make a metric per list and space
+    with timer("clickup_call_seconds", endpoint=re.sub(r"\d+", ":id", method)):
+        return await _call_method(method, params, timeout)
+
+
+async def _call_method(method: str, params: dict, timeout: float | None) -> dict:
+    attempt = 0
+    while True:
+        try:
+            async with get_limiter():
+                await _rate_limiter.acquire()
+                # Taken under the limiter, so a session replaced by a reload is not closed under this call
+                async with get_session().get(os.path.join(API_ENDPOINT, method),
+                                       params=encode_params(params),
+                                       headers={"Authorization": API_TOKEN},
+                                       timeout=aiohttp.ClientTimeout(total=timeout or TIMEOUT)) as r:
+                    if r.status == 429:
+                        _rate_limiter.exhaust(r.headers)
+                    else:
+                        _rate_limiter.observe(r.headers)
+                    if not r.ok:
+                        r.raise_for_status()
+                    return await r.json()
+        except Exception as e:
+            if not is_retryable(e) or attempt >= MAX_RETRIES:
+                raise
+            # A 429 already holds back every call until the reset, so only jitter is added on top
+            backoff = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            print(f"ClickUp call {method} failed ({type(e).__name__} {e}), retry {attempt + 1}/{MAX_RETRIES} in {backoff:.1f}s")
+            attempt += 1
+            await asyncio.sleep(backoff)
@@ -0,0 +1,80 @@
+"""Pre-built views of ClickUp tasks, rebuilt once per sync instead of on every query."""
+
+from __future__ import annotations
+
+import bisect
+import heapq
+import itertools
+from collections import Counter
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sus.clickup.abstract import ClickupTask
+
+
+def due_key(task: ClickupTask) -> tuple[int, float]:
+    # Tasks without a due date go last
+    return (0, task.due_date) if task.due_date is not None else (1, 0)
+
+
+class DueOrdered:
+    """Tasks sorted by due date, searchable by due date range."""
+
+    def __init__(self, tasks: list[ClickupTask]):
+        """`tasks` must already be sorted by `due_key`."""
+        self.tasks: list[ClickupTask] = tasks
+        self.keys: list[tuple[int, float]] = [due_key(task) for task in tasks]
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def between(self, start: float, end: float) -> list[ClickupTask]:
+        """Tasks due in [start, end)."""
+        return self.tasks[bisect.bisect_left(self.keys, (0, start)):bisect.bisect_left(self.keys, (0, end))]
+
+
+class ClickupTaskIndex:
+    def __init__(self, tasks: Iterable[ClickupTask] = ()):
+        """
+        Index `tasks` by due date, by tag and by status type.
+        Every view keeps tasks in due date order.
+        """
+        tasks = sorted(tasks, key=due_key)
+        by_tag: dict[str, list[ClickupTask]] = {}
+        by_status_type: dict[str, list[ClickupTask]] = {}
+        self.tag_counts: dict[str, Counter[str]] = {}
+        for task in tasks:
+            for tag in task.tags:
+                by_tag.setdefault(tag, []).append(task)
+            by_status_type.setdefault(task.status.type, []).append(task)
+            self.tag_counts.setdefault(task.status.type, Counter()).update(task.tags)
+
+        self.by_due = DueOrdered(tasks)
+        self.by_tag = {tag: DueOrdered(ele) for tag, ele in by_tag.items()}
+        self.by_status_type = {type: DueOrdered(ele) for type, ele in by_status_type.items()}
+
+    def with_tag(self, tag: str) -> DueOrdered:
+        return self.by_tag.get(tag) or DueOrdered([])
+
+    def with_status(self, types: list[str], exclude_tag: str | None = None,
+                    limit: int = -1) -> tuple[list[ClickupTask], int]:
+        r"""
+        Get tasks whose status type is one of `types`, in due date order.
+
+        :param exclude_tag: Skip tasks carrying this tag.
+        :param limit: Return at most this many tasks, negative for all.
+        :return: The tasks, and how many there are in total before `limit`.
+        """
+        views = [self.by_status_type[type] for type in types if type in self.by_status_type]
+        total = sum(len(view) for view in views)
+        if exclude_tag is not None:
+            total -= sum(self.tag_counts[type][exclude_tag] for type in types if type in self.tag_counts)
+
+        matched = heapq.merge(*views, key=due_key)
+        if exclude_tag is not None:
+            matched = (task for task in matched if exclude_tag not in task.tags)
+        return list(itertools.islice(matched, None if limit < 0 else limit)), total
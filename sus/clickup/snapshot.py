@@ -0,0 +1,135 @@
+"""Persist synced ClickUp data to SQLite, so a restart can serve it before the first sync."""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from sus.clickup.abstract import ClickupData, ClickupList, ClickupSpace, ClickupTask, ClickupTeam
+
+# Bump when the schema or the meaning of a column changes; older snapshots are then ignored
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta     (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS teams    (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS spaces   (id INTEGER PRIMARY KEY, team_id INTEGER, name TEXT);
+CREATE TABLE IF NOT EXISTS lists    (id INTEGER PRIMARY KEY, space_id INTEGER, name TEXT,
+                                     last_sync REAL, last_full_sync REAL);
+CREATE TABLE IF NOT EXISTS statuses (list_id INTEGER, id TEXT, name TEXT, type TEXT, orderindex INTEGER, color TEXT);
+CREATE TABLE IF NOT EXISTS tasks    (list_id INTEGER, id TEXT, name TEXT, tags TEXT, status_id TEXT, assignees TEXT,
+                                     date_updated TEXT, due_date TEXT, parent TEXT,
+                                     text_content TEXT, date_created TEXT, url TEXT);
+"""
+
+TABLES = ["meta", "teams", "spaces", "lists", "statuses", "tasks"]
+
+
+def to_millis(t: float | None) -> str | None:
+    return None if t is None else str(round(t * 1000))
+
+
+def collect(data: ClickupData, synced_at: float) -> tuple[dict[str, list[tuple]], list[tuple[int, list[ClickupTask]]]]:
+    """
+    Rows of every table but `tasks`, and the tasks of each list as `(list_id, tasks)`.
+    Tasks are only copied by reference, so this is cheap enough to run on the event loop; syncs replace
+    tasks instead of changing them, so `dump_rows` can flatten them in another thread afterwards.
+    """
+    rows = {table: [] for table in TABLES}
+    rows["meta"] = [("version", str(SCHEMA_VERSION)), ("user_id", str(data.user_id)), ("synced_at", str(synced_at))]
+    tasks = []
+    for team in data.teams:
+        rows["teams"].append((team.id, team.name))
+        for space in team.spaces:
+            rows["spaces"].append((space.id, team.id, space.name))
+            for list in space.lists:
+                rows["lists"].append((list.id, space.id, list.name, list.last_sync, list.last_full_sync))
+                rows["statuses"] += [(list.id, status.id, status.name, status.type, status.orderindex, status.color)
+                                     for status in list.statuses.values()]
+                tasks.append((list.id, [*list.task_map.values()]))
+    return rows, tasks
+
+
+def dump_rows(rows: dict[str, list[tuple]], tasks: list[tuple[int, list[ClickupTask]]]) -> dict[str, list[tuple]]:
+    """Add the rows of `tasks` to `rows`, both from `collect`. Slow for large workspaces, run it off the event loop."""
+    rows["tasks"] = [(list_id, task.id, task.name, json.dumps(sorted(task.tags)), task.status.id,
+                      json.dumps(task.assignees), to_millis(task.date_updated), to_millis(task.due_date),
+                      task.parent, task._text_content, task._date_created, task._url)
+                     for list_id, list_tasks in tasks for task in list_tasks]
+    return rows
+
+
+class ClickupSnapshot:
+    def __init__(self, path: str):
+        self.path: str = path
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def write(self, rows: dict[str, list[tuple]]):
+        """Replace the snapshot with `rows` from `dump_rows`, in a single transaction. Blocking."""
+        conn = self.connect()
+        try:
+            with conn:
+                for table in TABLES:
+                    conn.execute(f"DELETE FROM {table}")
+                    if rows[table]:
+                        placeholders = ", ".join("?" * len(rows[table][0]))
+                        conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows[table])
+        finally:
+            conn.close()
+
+    def read(self, max_child: int = 3) -> tuple[ClickupData, float] | None:
+        """
+        Rebuild the saved data and return it with the time it was synced. Blocking.
+        Return None if there is no usable snapshot.
+        """
+        if not os.path.exists(self.path):
+            return None
+        conn = self.connect()
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            if meta.get("version") != str(SCHEMA_VERSION):
+                return None
+
+            data = ClickupData(max_child=max_child)
+            data.user_id = int(meta["user_id"])
+            teams = {id: ClickupTeam({"id": id, "name": name}, data.user_id)
+                     for id, name in conn.execute("SELECT id, name FROM teams")}
+            data.teams = list(teams.values())
+
+            spaces = {}
+            for id, team_id, name in conn.execute("SELECT id, team_id, name FROM spaces"):
+                spaces[id] = ClickupSpace({"id": id, "name": name}, data.user_id)
+                teams[team_id].spaces.append(spaces[id])
+
+            lists = {}
+            for id, space_id, name, last_sync, last_full_sync in conn.execute("SELECT * FROM lists"):
+                lists[id] = ClickupList({"id": id, "name": name}, data.user_id)
+                lists[id].last_sync, lists[id].last_full_sync = last_sync, last_full_sync
+                spaces[space_id].lists.append(lists[id])
+
+            for list_id, id, name, type, orderindex, color in conn.execute("SELECT * FROM statuses"):
+                lists[list_id].intern_status({"id": id, "status": name, "type": type,
+                                              "orderindex": orderindex, "color": color})
+
+            task_maps = {id: {} for id in lists}
+            for (list_id, id, name, tags, status_id, assignees, date_updated, due_date,
+                 parent, text_content, date_created, url) in conn.execute("SELECT * FROM tasks"):
+                statuses = lists[list_id].statuses
+                task_maps[list_id][id] = ClickupTask({
+                    "id": id, "name": name, "tags": [{"name": tag} for tag in json.loads(tags)],
+                    "status": {"id": status_id}, "assignees": [{"id": user} for user in json.loads(assignees)],
+                    "date_updated": date_updated, "due_date": due_date, "parent": parent,
+                    "text_content": text_content, "date_created": date_created, "url": url}, statuses)
+        finally:
+            conn.close()
+
+        for id, clickup_list in lists.items():
+            clickup_list.status_list = list(clickup_list.statuses.values())
+            clickup_list.rebuild(task_maps[id])
+            clickup_list.refresh_views()
+        data.reindex()
+        return data, float(meta["synced_at"])
@@ -1,5 +1,7 @@
 """Handle configuration parameters."""
+import asyncio
 import json
+import os
 from getpass import getpass
 from sus.config.config import available_options
 
@@ -9,6 +11,12 @@ class ConfigHandler:
         self.required = []
         self.loaders = []
         self.loaded = False
+        # Options whose value was already checked when it was entered
+        self.checked = set()
+        self.subscribers = []
+        # The file `reload` reads, None if the config was not loaded from a file
+        self.path = None
+        self.mtime = None
 
     def get_configuration(self, name: str):
         r"""
@@ -22,22 +30,52 @@ class ConfigHandler:
             submapping = submapping[attr]
         return submapping
 
+    def set_configuration(self, name: str, value):
+        path = name.split('.')
+        submapping = self.mapping
+        for attr in path[:-1]:
+            submapping = submapping.setdefault(attr, {})
+        submapping[path[-1]] = value
+
     def after_load(self, func):
+        r"""
+        Register `func` to copy configuration values into globals.
+        It is called once the config is loaded, and again after every `reload` that changed something.
+        """
         if self.loaded:
             func()
-        else:
-            self.loaders.append(func)
+        self.loaders.append(func)
 
-    def load(self):
+    def on_change(self, func):
+        r"""
+        Register `func(changed)` to be notified by `reload`, after the loaders ran.
+        `changed` maps the name of each changed option to `(old value, new value)`.
+        `func` may be a coroutine function. Use `unsubscribe` to stop notifications, e.g. when a cog unloads.
         """
+        self.subscribers.append(func)
+        return func
+
+    def unsubscribe(self, func):
+        if func in self.subscribers:
+            self.subscribers.remove(func)
+
+    def load(self, mapping: dict | None = None):
+        r"""
         Load config, prompt missing config, and initalize all the registered loaders.
+
+        :param mapping: Use this config instead of reading `config.json`, e.g. for benchmarks.
         """
-        try:
-            with open('config.json') as config_file:
-                self.mapping = json.load(config_file)
-        except (ValueError, FileNotFoundError):
-            print("Failed to load config.json.")
-            self.mapping = {}
+        if mapping is not None:
+            self.mapping = mapping
+        else:
+            self.path = 'config.json'
+            try:
+                self.mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path) as config_file:
+                    self.mapping = json.load(config_file)
+            except (ValueError, FileNotFoundError):
+                print("Failed to load config.json.")
+                self.mapping = {}
 
         for i in range(len(available_options)):
             if len(available_options[i]) < 5:
@@ -62,6 +100,7 @@ class ConfigHandler:
                             read = input(f"Parameter {name}{f' ({external})' if external else ''} not found in config.json. Please enter the value: ")
                         if "checker" not in options or options["checker"](typename(read)):
                             passed = True
+                            self.checked.add(name)
                         else:
                             print("Checker failed. Please try again.")
                     submapping[path[-1]] = typename(read)
@@ -72,5 +111,134 @@ class ConfigHandler:
             loader()
         self.loaded = True
 
+    def read_file(self):
+        """Read `path` for `reload`, with its modification time. Blocking."""
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as config_file:
+            return json.load(config_file), mtime
+
+    @staticmethod
+    def lookup(mapping: dict, name: str):
+        """Get option `name` from `mapping`, or raise KeyError."""
+        for attr in name.split('.'):
+            mapping = mapping[attr]
+        return mapping
+
+    async def validate(self, name: str, typename, value, options: dict):
+        """Return `value` converted to `typename` if it passes the option's checker, or raise ValueError."""
+        # Converting would accept anything for these, e.g. bool("false")
+        if typename in (list, bool):
+            if not isinstance(value, typename):
+                raise ValueError(f"expected {typename.__name__}, got {type(value).__name__}")
+        elif not isinstance(value, typename) or isinstance(value, bool):
+            try:
+                value = typename(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"expected {typename.__name__}, got {value!r}") from e
+        if "checker" in options:
+            try:
+                passed = await asyncio.to_thread(options["checker"], value)
+            except Exception as e:
+                raise ValueError(f"checker failed: {e!r}") from e
+            if not passed:
+                raise ValueError("checker failed")
+        return value
+
+    async def reload(self):
+        """
+        Read the config file again and apply the options that changed, without a restart.
+        Only changed options are validated (type and checker), concurrently; invalid ones keep their old value,
+        as do options marked `restart` and options removed from the file that have no default.
+        Then the loaders run again, and subscribers are notified of the changes.
+        Return `(changed, rejected)`: the changes as passed to subscribers, and `{name: reason}` of rejected ones.
+        """
+        if self.path is None:
+            return {}, {}
+        try:
+            mapping, self.mtime = await asyncio.to_thread(self.read_file)
+        except (OSError, ValueError) as e:
+            print(f"Failed to reload {self.path}: {e}")
+            return {}, {}
+
+        candidates, rejected = [], {}
+        for name, typename, default, external, options in available_options:
+            old = self.get_configuration(name)
+            try:
+                new = self.lookup(mapping, name)
+            except (KeyError, TypeError):
+                if default is None:
+                    continue
+                new = default
+            if new == old:
+                continue
+            if "restart" in options:
+                rejected[name] = "takes effect after a restart"
+                continue
+            candidates.append((name, typename, old, new, options))
+
+        results = await asyncio.gather(*(self.validate(name, typename, new, options)
+                                         for name, typename, old, new, options in candidates), return_exceptions=True)
+        changed = {}
+        for (name, typename, old, new, options), result in zip(candidates, results):
+            if isinstance(result, Exception):
+                rejected[name] = str(result)
+                continue
+            self.set_configuration(name, result)
+            self.checked.add(name)
+            changed[name] = (old, result)
+
+        for name, reason in rejected.items():
+            print(f"Config {name} not reloaded: {reason}")
+        if not changed:
+            return changed, rejected
+        print(f"Reloaded config: {', '.join(changed)} changed")
+        for loader in self.loaders:
+            loader()
+        for subscriber in list(self.subscribers):
+            try:
+                result = subscriber(changed)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"Failed to apply reloaded config in {getattr(subscriber, '__qualname__', subscriber)}: {e!r}")
+        return changed, rejected
+
+    async def watch(self):
+        """
+        Forever: `reload` whenever the config file is modified, checking every `config.reload_interval` seconds.
+        While that is 0, the file is not checked, but the interval is looked at every minute (it may be reloaded on command).
+        """
+        while True:
+            interval = self.get_configuration("config.reload_interval")
+            await asyncio.sleep(interval if interval > 0 else 60)
+            if interval <= 0:
+                continue
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                continue
+            if mtime != self.mtime:
+                await self.reload()
+
+    async def check(self):
+        """
+        Run the checkers of all loaded options concurrently, in threads, and report the values that fail.
+        Checkers may do network round trips, so this is meant to run in the background once the bot is up.
+        Return the names of the options that failed.
+        """
+        checks = [(name, options["checker"]) for name, _, _, _, options in available_options
+                  if "checker" in options and name not in self.checked]
+        results = await asyncio.gather(*(asyncio.to_thread(checker, self.get_configuration(name)) for name, checker in checks),
+                                       return_exceptions=True)
+        failed = []
+        for (name, _), result in zip(checks, results):
+            if isinstance(result, Exception):
+                print(f"Cannot check config {name}: {result!r}")
+            elif not result:
+                print(f"Config {name} failed its check, please fix config.json")
+                failed.append(name)
+            self.checked.add(name)
+        return failed
+
 config_handler = ConfigHandler()
 
@@ -1,5 +1,5 @@
-import requests
-
 def clickup_checker(token):
+    # Only needed when checking, and slow to import
+    import requests
     API_ENDPOINT = "https://api.clickup.com/api/v2/user"
-    return requests.get(API_ENDPOINT, headers={"Authorization": token}).status_code == 200
\ No newline at end of file
+    return requests.get(API_ENDPOINT, headers={"Authorization": token}, timeout=10).status_code == 200
@@ -2,14 +2,43 @@ from sus.config.checker import *
 
 available_options = [
 #   [internal name, type, default value, description, extra],
-    ["token",                           str, None, None, {"secret": True}],
+    ["token",                           str, None, None, {"secret": True, "restart": True}],
+    ["cogs",                            list, ["sus.swapfinder.SwapFinderCog", "sus.idfinder.StudentIDCog", "sus.clickup.ClickupCog"], None, {"restart": True}],
+    ["config.reload_interval",          float, 5.0, None],
     ["swapfinder.scan_path",            str, None, None],
     ["swapfinder.report_channel_id",    int, None, None],
     ["swapfinder.max_preview_size",     int, 1024 * 1024 * 8, None],
     ["swapfinder.max_file_size",        int, 1024 * 1024 * 64, None],
     ["swapfinder.preview_size",         int, 400, None],
+    ["swapfinder.scan_interval",        float, 5.0, None],
+    ["swapfinder.watch",                bool, False, None],
+    ["swapfinder.debounce",             float, 2.0, None],
+    ["swapfinder.vim_fallback",         bool, True, None],
+    ["swapfinder.workers",              int, 4, None],
+    ["swapfinder.recover_timeout",      float, 10.0, None],
+    ["swapfinder.scan_depth",           int, 0, None],
+    ["swapfinder.index_path",           str, "swapfinder_index.sqlite3", None],
+    ["idfinder.cache_size",             int, 1024, None],
+    ["idfinder.cache_ttl",              float, 60 * 60 * 24, None],
+    ["idfinder.negative_ttl",           float, 60 * 10, None],
+    ["idfinder.timeout",                float, 5.0, None],
+    ["outbox.queue_size",               int, 50, None, {"restart": True}],
+    ["metrics.window",                  int, 1024, None],
+    ["metrics.lag_interval",            float, 0.5, None],
+    ["metrics.export_path",             str, "metrics.prom", None],
+    ["metrics.export_interval",         float, 15.0, None],
+    ["watchdog.enabled",                bool, False, None, {"restart": True}],
+    ["watchdog.threshold",              float, 0.25, None, {"restart": True}],
     ["clickup.token",                   str, None, None, {"secret": True, "checker": clickup_checker}],
     ["clickup.mention_id",              int, None, None],
     ["clickup.report_channel_id",       int, None, None],
+    ["clickup.api_endpoint",            str, "https://api.clickup.com/api/v2/", None],
+    ["clickup.timeout",                 float, 10.0, None],
+    ["clickup.max_concurrency",         int, 8, None],
+    ["clickup.max_retries",             int, 4, None],
+    ["clickup.page_prefetch",           int, 3, None],
+    ["clickup.full_sync_interval",      int, 60 * 60 * 6, None],
+    ["clickup.cache_ttl",               int, 60 * 5, None],
+    ["clickup.snapshot_path",           str, "clickup_snapshot.sqlite3", None, {"restart": True}],
 ]
     
\ No newline at end of file
@@ -1,31 +1,130 @@
 from   discord.ext import commands
+from   collections import OrderedDict
+from   sus.basiclib.metrics import timed
+from   sus.config import config_handler
+import asyncio
 import subprocess
+import time
 import re
 
+CACHE_SIZE, CACHE_TTL, NEGATIVE_TTL, QUERY_TIMEOUT = None, None, None, None
+@config_handler.after_load
+def __load_config():
+    global CACHE_SIZE, CACHE_TTL, NEGATIVE_TTL, QUERY_TIMEOUT
+    CACHE_SIZE =    config_handler.get_configuration("idfinder.cache_size")
+    CACHE_TTL =     config_handler.get_configuration("idfinder.cache_ttl")
+    NEGATIVE_TTL =  config_handler.get_configuration("idfinder.negative_ttl")
+    QUERY_TIMEOUT = config_handler.get_configuration("idfinder.timeout")
+
 
 class StudentIDFinder:
     class InvalidIDError(Exception):
         pass
 
+    # student_id -> (name or None, expiry on the time.monotonic() clock), least recently used first
+    cache: OrderedDict = OrderedDict()
+    # Lookups in progress, shared by everyone asking for the same id
+    pending: dict = {}
+
+    @classmethod
+    def check_id(cls, student_id):
+        if not re.match(r"^[br][0-9]{8}$", student_id):
+            raise cls.InvalidIDError
+
+    @classmethod
+    def parse_output(cls, returncode, stdout):
+        if returncode != 0: # catch base64 error
+            return None
+        if stdout == b"\n": # catch no entry
+            return None
+        return stdout.decode()[:-1] # escape newline
+
+    @classmethod
+    def cached(cls, student_id):
+        """
+        Return `(True, name)` if the result for `student_id` is cached and fresh, `(False, None)` otherwise.
+        """
+        entry = cls.cache.get(student_id)
+        if entry is None:
+            return False, None
+        name, expiry = entry
+        if time.monotonic() >= expiry:
+            del cls.cache[student_id]
+            return False, None
+        cls.cache.move_to_end(student_id)
+        return True, name
+
     @classmethod
+    def remember(cls, student_id, name):
+        """Cache `name`. Ids without an entry are cached too, for a shorter time."""
+        ttl = CACHE_TTL if name is not None else NEGATIVE_TTL
+        cls.cache[student_id] = (name, time.monotonic() + ttl)
+        cls.cache.move_to_end(student_id)
+        while len(cls.cache) > CACHE_SIZE:
+            cls.cache.popitem(last=False)
+
+    @classmethod
+    @timed("idfinder_query_seconds", mode="sync")
     def raw_query_id(cls, student_id):
         """
-        Query `student_id` using ldap.  
+        Query `student_id` using ldap.
         Raise InvalidIDError if student_id is not a valid id.
         Return None if the given `student_id` has no entry for name.
+        Blocking; use `async_raw_query_id` on the event loop.
         """
-        if not re.match(r"^[br][0-9]{8}$", student_id):
-            raise cls.InvalidIDError
-        
+        cls.check_id(student_id)
+        hit, name = cls.cached(student_id)
+        if hit:
+            return name
+
         res = subprocess.run(["getName", student_id], capture_output=True)
 
-        if res.returncode != 0: # catch base64 error
-            return None
-        if res.stdout == b"\n": # catch no entry
+        name = cls.parse_output(res.returncode, res.stdout)
+        cls.remember(student_id, name)
+        return name
+
+    @classmethod
+    @timed("idfinder_getname_seconds")
+    async def _run_query(cls, student_id):
+        try:
+            proc = await asyncio.create_subprocess_exec("getName", student_id,
+                                                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            print(f"Cannot run getName: {e}")
             return None
-        
-        return res.stdout.decode()[:-1] # escape newline
-    
+        try:
+            stdout, _ = await asyncio.wait_for(proc.communicate(), QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            print(f"getName {student_id} took more than {QUERY_TIMEOUT}s, killed")
+            return None # not cached, ldap may just be slow right now
+
+        name = cls.parse_output(proc.returncode, stdout)
+        cls.remember(student_id, name)
+        return name
+
+    @classmethod
+    @timed("idfinder_query_seconds", mode="async")
+    async def async_raw_query_id(cls, student_id):
+        """
+        Same as `raw_query_id` but does not block the event loop.
+        Concurrent queries of the same id share a single `getName` process.
+        Return None as well if `getName` fails to run or times out.
+        """
+        cls.check_id(student_id)
+        hit, name = cls.cached(student_id)
+        if hit:
+            return name
+
+        task = cls.pending.get(student_id)
+        if task is None:
+            task = asyncio.create_task(cls._run_query(student_id))
+            cls.pending[student_id] = task
+            task.add_done_callback(lambda _: cls.pending.pop(student_id, None))
+        # A cancelled caller must not cancel the query for the others
+        return await asyncio.shield(task)
+
     @classmethod
     def query_id(cls, student_id):
         """
@@ -39,6 +138,19 @@ class StudentIDFinder:
             name = ''
         return name
 
+    @classmethod
+    async def async_query_id(cls, student_id):
+        """
+        Same as `async_raw_query_id` but returns '' if the id is invaid or does not exist.
+        """
+        try:
+            name = await cls.async_raw_query_id(student_id)
+        except cls.InvalidIDError:
+            return ''
+        if name == None:
+            name = ''
+        return name
+
 class StudentIDCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -49,10 +161,10 @@ class StudentIDCog(commands.Cog):
         Get a given name of id by ldap on workstation.
         """
         try:
-            res = StudentIDFinder.raw_query_id(student_id)
+            res = await StudentIDFinder.async_raw_query_id(student_id)
         except StudentIDFinder.InvalidIDError:
             await ctx.respond(f"Error! ID is not valid.")
             return
-        
+
         name = "Not found" if res == None else f"`{res}`"
         await ctx.respond(f"`{student_id}` → {name}")
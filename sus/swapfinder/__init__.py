@@ -1,20 +1,26 @@
 from   sus.swapfinder.swapfinder import *
 from   sus.basiclib import *
+from   sus.basiclib.metrics import timed
+from   sus.basiclib.outbox import outbox_for
 from   sus.config import config_handler
 from   sus.idfinder import StudentIDFinder as sidf
 from   discord.ext  import tasks, commands
-import time
 import discord
 
 # Define and load configurations
 
 SCAN_PATH, REPORT_CHANNEL_ID, MAX_PREVIEW_SIZE = None, None, None
+SCAN_INTERVAL, WATCH, DEBOUNCE, SCAN_DEPTH = None, None, None, None
 @config_handler.after_load
 def __load_config():
-    global SCAN_PATH, REPORT_CHANNEL_ID, MAX_PREVIEW_SIZE
+    global SCAN_PATH, REPORT_CHANNEL_ID, MAX_PREVIEW_SIZE, SCAN_INTERVAL, WATCH, DEBOUNCE, SCAN_DEPTH
     SCAN_PATH =         config_handler.get_configuration("swapfinder.scan_path")
     REPORT_CHANNEL_ID = config_handler.get_configuration("swapfinder.report_channel_id")
     MAX_PREVIEW_SIZE =  config_handler.get_configuration("swapfinder.max_preview_size")   
+    SCAN_INTERVAL =     config_handler.get_configuration("swapfinder.scan_interval")
+    WATCH =             config_handler.get_configuration("swapfinder.watch")
+    DEBOUNCE =          config_handler.get_configuration("swapfinder.debounce")
+    SCAN_DEPTH =        config_handler.get_configuration("swapfinder.scan_depth")
 
 # Integration with discord
 
@@ -22,10 +28,55 @@ class SwapFinderCog(commands.Cog):
     def __init__(self, bot):
         self.sf = VimSwapFileFinder()
         self.bot = bot
-        self.prober.start()
+        self.watcher = None
+        self.start_scanning()
+        config_handler.on_change(self.on_config_change)
+
+    def start_scanning(self):
+        """Watch SCAN_PATH with inotify if enabled and possible, otherwise poll it every SCAN_INTERVAL minutes."""
+        if WATCH and SCAN_DEPTH > 0:
+            print(f"Cannot watch subdirectories of {SCAN_PATH} with inotify, polling every {SCAN_INTERVAL} minute(s) instead")
+        elif WATCH:
+            try:
+                self.watcher = self.sf.watch(SCAN_PATH, self.on_swap_change, DEBOUNCE, self.bot.loop)
+                print(f"Watching {SCAN_PATH} for swap files with inotify")
+            except OSError as e:
+                print(f"Cannot watch {SCAN_PATH} with inotify ({e}), polling every {SCAN_INTERVAL} minute(s) instead")
+        if self.watcher is None:
+            self.prober.change_interval(minutes=SCAN_INTERVAL)
+            if not self.prober.is_running():
+                self.prober.start()
+        elif self.prober.is_running():
+            self.prober.cancel()
+
+    def on_config_change(self, changed):
+        """Apply reloaded options to the running cog."""
+        if "swapfinder.workers" in changed:
+            # Recoveries in progress finish in the old pool, new ones start a pool of the new size
+            self.sf.close_pool(cancel=False)
+        if "swapfinder.index_path" in changed:
+            self.sf.save_index()
+            # Not INDEX_PATH: the reload only updates it in sus.swapfinder.swapfinder, not the copy imported here
+            self.sf.index = SwapIndex(changed["swapfinder.index_path"][1])
+        if changed.keys() & {"swapfinder.scan_path", "swapfinder.watch", "swapfinder.debounce", "swapfinder.scan_depth"}:
+            if self.watcher is not None:
+                self.watcher.stop()
+                self.watcher = None
+            self.start_scanning()
+        elif "swapfinder.scan_interval" in changed and self.watcher is None:
+            # Takes effect in the current wait already
+            self.prober.change_interval(minutes=SCAN_INTERVAL)
 
     def cog_unload(self):
+        config_handler.unsubscribe(self.on_config_change)
         self.prober.cancel()
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.sf.close()
+
+    def on_swap_change(self, paths):
+        """Called by the watcher with changed swap files, or None to rescan everything."""
+        self.bot.loop.create_task(self.report(paths))
 
     @commands.slash_command()
     async def scan_tmp(self, ctx: discord.ApplicationContext, delay_hour: int = 1):
@@ -34,31 +85,50 @@ class SwapFinderCog(commands.Cog):
         """
         await ctx.defer()
         
-        self.sf.update_time(datetime.datetime.now() - datetime.timedelta(hours=delay_hour))
-        flist = self.sf.scan_directory(SCAN_PATH, True)
-        self.sf.update_time()
+        since = datetime.datetime.now() - datetime.timedelta(hours=delay_hour)
+        outbox = outbox_for(self.bot.get_channel(REPORT_CHANNEL_ID))
+        found = 0
 
-        await ctx.followup.send(f"Found {len(flist)} unprotected edit.")
-        channel = self.bot.get_channel(REPORT_CHANNEL_ID)
-        
-        for filename, size, owner, last_modify, preview in flist:
+        # A manual scan reports everything in the window again, and leaves the periodic reports alone
+        async for content in self.sf.iter_directory(SCAN_PATH, True, since=since, dedup=False):
+            filename, size, owner, last_modify, preview = content[:5]
+            found += 1
             if size < MAX_PREVIEW_SIZE:
-                await channel.send(f'`{owner}` did some unprotected edit with swap file `{filename}` (size `{convert_bytes(size)}`) at time `{str(last_modify)}`:', file=discord.File(preview.name, filename=filename[:-4]))
+                # The attachment keeps the file open, so the temporary file can be closed (and removed) now
+                await outbox.send(f'`{owner}` did some unprotected edit with swap file `{filename}` (size `{convert_bytes(size)}`) at time `{str(last_modify)}`:', file=discord.File(preview.name, filename=filename[:-4]))
             else:
-                await channel.send(f'`{owner}` did some unprotected edit with swap file `{filename}` (size `{convert_bytes(size)}`) at time `{str(last_modify)}`. File is too huge.')
+                await outbox.send(f'`{owner}` did some unprotected edit with swap file `{filename}` (size `{convert_bytes(size)}`) at time `{str(last_modify)}`. File is too huge.')
             preview.close()
-            time.sleep(0.200) # sleep 0.2s to prevent too much input
+
+        await outbox.flush()
+        await ctx.followup.send(f"Found {found} unprotected edit.")
+
+    @timed("task_seconds", task="swapfinder.report")
+    async def report(self, paths = None):
+        """
+        Report swap files modified since the last report.
+        Only `paths` are checked if given, otherwise the whole `SCAN_PATH`.
+        Files reported before are only reported again, as a diff, if their preview changed.
+        `paths` from the watcher are checked whatever their time, so only a full scan moves `last_check`.
+        """
+        await self.bot.wait_until_ready()
+        outbox = outbox_for(self.bot.get_channel(REPORT_CHANNEL_ID))
+        # Files modified while scanning are caught by the next report
+        start = datetime.datetime.now()
+        async for filename, size, owner, last_modify, preview, previous in self.sf.iter_directory(SCAN_PATH, paths=paths):
+            name = await sidf.async_query_id(owner)
+            if previous is not None:
+                await outbox.send(f'`{owner} ({name})` kept editing swap file `{filename}` (size `{convert_bytes(size)}`) at time `{str(last_modify)}`:\n```diff\n{preview_diff(previous, preview) or " "}```')
+            else:
+                if preview == '': # prevent weird display error
+                    preview = '\n'
+                await outbox.send(f'`{owner} ({name})` did some unprotected edit with swap file `{filename}` (size `{convert_bytes(size)}`) at time `{str(last_modify)}`:\n```{preview}```')
+        if paths is None:
+            self.sf.update_time(start)
 
     @tasks.loop(minutes=5.0)
     async def prober(self):
-        channel = self.bot.get_channel(REPORT_CHANNEL_ID)
-        flist = self.sf.scan_directory(SCAN_PATH)
-        self.sf.update_time()
-        for filename, size, owner, last_modify, preview in flist:
-            if preview == '': # prevent weird display error
-                preview = '\n'
-            await channel.send(f'`{owner} ({sidf.query_id(owner)})` did some unprotected edit with swap file `{filename}` (size `{convert_bytes(size)}`) at time `{str(last_modify)}`:\n```{preview}```')
-            time.sleep(0.200) # sleep 0.2s to prevent too much input
+        await self.report()
 
     @prober.before_loop
     async def before_prober(self):
@@ -0,0 +1,102 @@
+"""Remember reported swap files across restarts, so only real changes are reported again."""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from collections import namedtuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reported (dev INTEGER, ino INTEGER, path TEXT, mtime_ns INTEGER, size INTEGER,
+                                     hash TEXT, preview TEXT, PRIMARY KEY (dev, ino));
+"""
+
+# What was last reported of the swap file with (device, inode) `key`
+IndexEntry = namedtuple('IndexEntry', ['key', 'path', 'mtime_ns', 'size', 'hash', 'preview'])
+
+
+def preview_hash(preview: str) -> str:
+    return hashlib.blake2b(preview.encode(errors='replace'), digest_size=16).hexdigest()
+
+
+class SwapIndex:
+    def __init__(self, path: str | None = None):
+        """
+        Entries are kept in memory and, unless `path` is empty, saved to SQLite by `save`.
+        `unchanged` and `update` are safe to call from several threads.
+        """
+        self.path: str | None = path
+        self.entries: dict[tuple[int, int], IndexEntry] = {}
+        self.dirty: set[tuple[int, int]] = set()
+        self.removed: set[tuple[int, int]] = set()
+        self.lock = threading.Lock()
+        self.loaded: bool = False
+        self.load_lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def load(self):
+        """Read the saved entries, on the first call only. Blocking."""
+        with self.load_lock:
+            if self.loaded or not self.path:
+                return
+            # Do not retry a broken file on every scan
+            self.loaded = True
+            conn = self.connect()
+            try:
+                rows = conn.execute("SELECT dev, ino, path, mtime_ns, size, hash, preview FROM reported").fetchall()
+            finally:
+                conn.close()
+            with self.lock:
+                for dev, ino, *entry in rows:
+                    self.entries.setdefault((dev, ino), IndexEntry((dev, ino), *entry))
+
+    def save(self):
+        """Write the entries changed since the last save, in a single transaction. Blocking."""
+        with self.lock:
+            changed = [self.entries[key] for key in self.dirty if key in self.entries]
+            removed = list(self.removed)
+            self.dirty.clear()
+            self.removed.clear()
+        if not self.path or not (changed or removed):
+            return
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany("DELETE FROM reported WHERE dev = ? AND ino = ?", removed)
+                conn.executemany("INSERT OR REPLACE INTO reported VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(*entry.key, *entry[1:]) for entry in changed])
+        finally:
+            conn.close()
+
+    def unchanged(self, key: tuple[int, int], path: str, mtime_ns: int, size: int) -> bool:
+        """Whether the swap file is exactly as last reported, so recovering it again is pointless."""
+        entry = self.entries.get(key)
+        return entry is not None and (entry.path, entry.mtime_ns, entry.size) == (path, mtime_ns, size)
+
+    def update(self, key: tuple[int, int], path: str, mtime_ns: int, size: int, preview: str):
+        """
+        Record the recovered `preview` of a swap file.
+        Return `(changed, previous)`: whether the preview differs from the last report, and the preview
+        last reported for the same file (None if it is new, or its inode now belongs to another file).
+        """
+        hash = preview_hash(preview)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.path != path: # inode reused
+                entry = None
+            changed = entry is None or entry.hash != hash
+            self.entries[key] = IndexEntry(key, path, mtime_ns, size, hash, preview if changed else entry.preview)
+            self.dirty.add(key)
+        return changed, entry.preview if entry is not None else None
+
+    def prune(self, seen: set[tuple[int, int]]):
+        """Forget swap files not in `seen`, e.g. after a full scan found them removed."""
+        with self.lock:
+            for key in self.entries.keys() - seen:
+                del self.entries[key]
+                self.removed.add(key)
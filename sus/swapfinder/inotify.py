@@ -0,0 +1,154 @@
+"""Minimal Linux inotify binding via ctypes, and a debounced watcher for swap files."""
+
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+SWAP_NAME = re.compile(r"\.sw.$")
+
+_libc = None
+
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+class Inotify:
+    def __init__(self):
+        """
+        Create a non-blocking inotify instance.
+        Raise OSError if inotify is unavailable or the per-user instance limit is reached.
+        """
+        try:
+            fd = libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not supported on this platform")
+        if fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.fd: int = fd
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """
+        Watch `path` for events in `mask` and return the watch descriptor.
+        Raise OSError; `errno.ENOSPC` means the watch limit (`fs.inotify.max_user_watches`) is hit.
+        """
+        wd = libc().inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        return wd
+
+    def read_events(self) -> list[tuple[int, int, int, str]]:
+        """Read all pending events as `(wd, mask, cookie, name)` without blocking."""
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, cookie, name))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class SwapFileWatcher:
+    def __init__(self, dir: str, callback, debounce: float = 2.0):
+        """
+        Watch `dir` for swap files (`*.sw?`) being created or written.
+
+        `callback(paths)` is called on the event loop with the set of changed swap files, once each of them
+        has been quiet for `debounce` seconds, so a burst of writes is reported once.
+        It is called with None if the kernel dropped events, in which case `dir` should be rescanned.
+        """
+        self.dir: str = dir
+        self.callback = callback
+        self.debounce: float = debounce
+        self.inotify: Inotify | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.pending: dict[str, float] = {}
+        self.timer: asyncio.TimerHandle | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Start watching, with events handled on `loop`.
+        Raise OSError if inotify cannot be used, e.g. when the watch limit is hit.
+        """
+        self.loop = loop
+        self.inotify = Inotify()
+        try:
+            self.inotify.add_watch(self.dir, IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO)
+        except OSError:
+            self.inotify.close()
+            self.inotify = None
+            raise
+        loop.add_reader(self.inotify.fileno(), self._on_readable)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.inotify is not None:
+            self.loop.remove_reader(self.inotify.fileno())
+            self.inotify.close()
+            self.inotify = None
+
+    def _on_readable(self):
+        now = time.monotonic()
+        for wd, mask, cookie, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                self.pending.clear()
+                self.callback(None)
+                continue
+            if mask & (IN_ISDIR | IN_IGNORED) or not SWAP_NAME.search(name):
+                continue
+            self.pending[os.path.join(self.dir, name)] = now
+        if self.pending and self.timer is None:
+            self.timer = self.loop.call_later(self.debounce, self._flush)
+
+    def _flush(self):
+        self.timer = None
+        now = time.monotonic()
+        ready = {path for path, last in self.pending.items() if now - last >= self.debounce}
+        for path in ready:
+            del self.pending[path]
+        if self.pending:
+            self.timer = self.loop.call_later(self.debounce - (now - max(self.pending.values())), self._flush)
+        if ready:
+            self.callback(ready)
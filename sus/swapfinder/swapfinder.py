@@ -1,142 +1,599 @@
+import asyncio
 from   collections import namedtuple
+from   concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from   concurrent.futures.process import BrokenProcessPool
 import datetime
+import difflib
+import itertools
+import multiprocessing
 import os
 from   pwd import getpwuid
 import re
+import shutil
+import sqlite3
 import subprocess
 import stat
 import string
+from   sus.basiclib.metrics import observe, timed
 from   sus.config import config_handler
+from   sus.swapfinder.index import SwapIndex
+from   sus.swapfinder.inotify import SwapFileWatcher
+from   sus.swapfinder.swapparser import SwapParseError, SwapParseTimeout, VimSwapParser
 import tempfile
+import time
 
 PREVIEW_SIZE = None
 MAX_FILE_SIZE = None
+VIM_FALLBACK = None
+WORKERS = None
+RECOVER_TIMEOUT = None
+SCAN_DEPTH = None
+INDEX_PATH = None
+
+# Recoveries started ahead of the consumer, per worker
+RECOVERY_WINDOW = 2
+
+# Seconds added to the deadline of a recovery before its worker is killed, and how often to check for
+# recoveries started by a worker while waiting for results
+RECOVERY_GRACE = 5
+RECOVERY_POLL = 1
+
+# A character is at most 4 bytes in UTF-8, so this many bytes always hold a full preview
+PREVIEW_BYTES_PER_CHAR = 4
 
 @config_handler.after_load
 def __load_config():
-    global PREVIEW_SIZE, MAX_FILE_SIZE
-    PREVIEW_SIZE =  config_handler.get_configuration("swapfinder.preview_size")
-    MAX_FILE_SIZE = config_handler.get_configuration("swapfinder.max_file_size")
+    global PREVIEW_SIZE, MAX_FILE_SIZE, VIM_FALLBACK, WORKERS, RECOVER_TIMEOUT, SCAN_DEPTH, INDEX_PATH
+    PREVIEW_SIZE =    config_handler.get_configuration("swapfinder.preview_size")
+    MAX_FILE_SIZE =   config_handler.get_configuration("swapfinder.max_file_size")
+    VIM_FALLBACK =    config_handler.get_configuration("swapfinder.vim_fallback")
+    WORKERS =         config_handler.get_configuration("swapfinder.workers")
+    RECOVER_TIMEOUT = config_handler.get_configuration("swapfinder.recover_timeout")
+    SCAN_DEPTH =      config_handler.get_configuration("swapfinder.scan_depth")
+    INDEX_PATH =      config_handler.get_configuration("swapfinder.index_path")
+
+# `previous` is the preview last reported for the same swap file, if it was reported before and has changed since
+SwapContent = namedtuple('SwapContent', ['filename', 'size', 'owner', 'last_modify', 'preview', 'previous'], defaults=[None])
+# `key` is (device, inode), which with `mtime_ns` and `size` tells whether the file changed since it was reported
+SwapCandidate = namedtuple('SwapCandidate', ['filename', 'size', 'owner', 'last_modify', 'key', 'mtime_ns'])
+
+class Recovery:
+    """A recovery from `start_recoveries`: its candidate, output file, pool and future, and when a worker took it."""
+    def __init__(self, candidate, output, pool, future, retried: bool = False):
+        self.candidate = candidate
+        self.output = output
+        self.pool = pool
+        # The live pid -> process map of a process pool, kept since shutting the pool down forgets it
+        self.processes: dict | None = getattr(pool, "_processes", None)
+        self.future = future
+        self.retried: bool = retried
+        self.started: float | None = None
+
+def recover_with_vim(filename: string, out_path: string, timeout: float = 10):
+    """
+    Recover a swap file with `vim -r` into the file `out_path`. Return True on success, None on failure.
+    Slow (a vim process per file), kept for swap files the parser does not understand, e.g. encrypted ones.
+    """
+    if not re.match(r'^[~\ +\-\_A-Za-z0-9\/\.]*$', filename):
+        print("Bad file name")
+        return None
+
+    try:
+        scriptfile = tempfile.NamedTemporaryFile(mode='w+')
+        FNULL = open(os.devnull, 'w')
+        # Overwrite `out_path` in place, the caller may hold it open
+        scriptfile.write(f":set backupcopy=yes\n:w! {out_path}\n:q!\n")
+        scriptfile.flush()
+
+    except:
+        print(f"Cannot capture swap file {filename}: tempfile cannot be created", flush=True)
+
+    finally:
+
+        success = True
+
+        try:
+            vim = subprocess.Popen([f'vim', '-r', filename, '-s', scriptfile.name], stderr=subprocess.STDOUT, stdout=FNULL)
+            vim.wait(timeout)
+
+            if vim.returncode == 0:
+                print(f"vim recovered. Swap file {filename}", flush=True)
+            else:
+                print(f"vim recover failed. Maybe the file is not valid or the script is not working. Swap file {filename}", flush=True)
+                success = False
 
-SwapContent = namedtuple('SwapContent', ['filename', 'size', 'owner', 'last_modify', 'preview'])
+        except subprocess.TimeoutExpired:
+            print(f"vim session timeout. Maybe the file is too large or the script is not working. Swap file {filename}", flush=True)
+            vim.kill()
+            vim.wait()
+            success = False
+
+    scriptfile.close()
+    return True if success else None
+
+def recover_file(filename: string, out_path: string, timeout: float = None, vim_fallback: bool = False,
+                 max_original_size: int = None):
+    """
+    Recover a swap file into the existing file `out_path`, streamed a block at a time.
+    Return True on success, None on failure. Give up after `timeout` seconds.
+    Runs in worker processes, so settings are passed in rather than read from the configuration.
+    """
+    try:
+        # The file must exist: if the caller gave up on this recovery and deleted it, do not create it again
+        out = open(out_path, 'r+b')
+    except OSError:
+        return None
+    with out:
+        # Left over from a worker that died halfway, if this is a retry
+        out.truncate()
+        try:
+            VimSwapParser.write_file(filename, out, timeout, max_original_size)
+            return True
+        except SwapParseTimeout:
+            print(f"Recovering swap file {filename} took more than {timeout}s, skipped", flush=True)
+            return None
+        except (SwapParseError, OSError) as e:
+            print(f"Cannot parse swap file {filename} ({e})", flush=True)
+    if vim_fallback and shutil.which('vim'):
+        return recover_with_vim(filename, out_path, timeout or 10)
+    return None
+
+def recover_text(filename: string, limit: int = None, timeout: float = None, vim_fallback: bool = False,
+                 max_original_size: int = None):
+    """
+    Recover a swap file and return (about the first `limit` bytes of) the file contents, or None on failure.
+    Like `recover_file`, runs in worker processes.
+    """
+    try:
+        return VimSwapParser.read_file(filename, limit, timeout, max_original_size).decode(errors='replace')
+    except SwapParseTimeout:
+        print(f"Recovering swap file {filename} took more than {timeout}s, skipped", flush=True)
+        return None
+    except (SwapParseError, OSError) as e:
+        print(f"Cannot parse swap file {filename} ({e})", flush=True)
+    if not (vim_fallback and shutil.which('vim')):
+        return None
+    with tempfile.NamedTemporaryFile(mode='rb') as capturefile:
+        if recover_with_vim(filename, capturefile.name, timeout or 10) is None:
+            return None
+        return capturefile.read(limit if limit is not None else -1).decode(errors='replace')
+
+def preview_diff(previous: string, preview: string):
+    """Line diff from `previous` to `preview`, without the file headers of a unified diff."""
+    return '\n'.join(list(difflib.unified_diff(previous.splitlines(), preview.splitlines(), lineterm='', n=1))[2:])
 
 class VimSwapFileFinder:
     def __init__(self):
         self.last_check = datetime.datetime.now() - datetime.timedelta(hours=1)
+        self.executor = None
+        self.pool = None
+        self.owners = {}
+        self.index = SwapIndex(INDEX_PATH)
 
     def update_time(self, time = None):
         time = time or datetime.datetime.now()
         self.last_check = time
 
-    def recover_swap_file(self, filename: string, getfile: bool = False):
+    @timed("swapfinder_recover_swap_file_seconds")
+    def recover_swap_file(self, filename: string, getfile: bool = False, limit: int = None):
         """
         Recover a swap file specified by `filename` and return full file contents.
         It should be guranteed the file size is not too big to recover.
         If `getfile` is True, it returns a opened temp file instead of contents.
+        If `limit` is given, only about the first `limit` bytes of the file are recovered.
+        The swap file is parsed directly; vim is only run for files the parser cannot read.
         """
-        if not re.match(r'^[~\ +\-\_A-Za-z0-9\/\.]*$', filename):
-            print("Bad file name")
+        if not getfile:
+            return recover_text(filename, limit, RECOVER_TIMEOUT, VIM_FALLBACK, MAX_FILE_SIZE)
+        output = tempfile.NamedTemporaryFile(mode='w+b')
+        if recover_file(filename, output.name, RECOVER_TIMEOUT, VIM_FALLBACK, MAX_FILE_SIZE) is None:
+            output.close()
             return None
+        return output
 
-        try:
-            scriptfile = tempfile.NamedTemporaryFile(mode='w+')
-            capturefile = tempfile.NamedTemporaryFile(mode='w+')
-            FNULL = open(os.devnull, 'w')
-            scriptfile.write(f":w! {capturefile.name}\n:q!\n")
-            scriptfile.flush()
+    def owner_of(self, uid: int):
+        """User name of `uid`, cached since a few users own most swap files."""
+        owner = self.owners.get(uid)
+        if owner is None:
+            try:
+                owner = getpwuid(uid).pw_name
+            except KeyError: # no passwd entry, e.g. a removed account
+                owner = str(uid)
+            self.owners[uid] = owner
+        return owner
+
+    def check_candidate(self, fullname: string, st: os.stat_result, since: float, dedup: bool = True):
+        """
+        Return a SwapCandidate if the swap file `fullname` with lstat result `st` should be recovered, otherwise None.
+        Files modified before the timestamp `since` are skipped, and with `dedup` also those unchanged since reported.
+        """
+        # detect regular and readable file
+        if not stat.S_ISREG(st.st_mode) or not st.st_mode & (stat.S_IRGRP):
+            return None
 
-        except:
-            print(f"Cannot capture swap file {filename}: tempfile cannot be created", flush=True)
+        # detect size <= MAX_FILE_SIZE
+        if st.st_size > MAX_FILE_SIZE:
+            return None
 
-        finally:
+        if st.st_mtime < since:
+            return None
+
+        key = (st.st_dev, st.st_ino)
+        if dedup and self.index.unchanged(key, fullname, st.st_mtime_ns, st.st_size):
+            return None
 
-            success = True
+        last_modify = datetime.datetime.fromtimestamp(st.st_mtime)
+        return SwapCandidate(fullname, st.st_size, self.owner_of(st.st_uid), last_modify, key, st.st_mtime_ns)
 
+    def walk(self, dir: string, depth: int = 0):
+        """
+        Yield `(fullname, lstat result)` of the swap files in `dir`, and in its subdirectories up to `depth` levels down.
+        Only swap file names are stat'ed, once each; symlinks are never followed.
+        """
+        stack = [(dir, 0)]
+        while stack:
+            path, level = stack.pop()
             try:
-                vim = subprocess.Popen([f'vim', '-r', filename, '-s', scriptfile.name], stderr=subprocess.STDOUT, stdout=FNULL)
-                vim.wait(10)
+                dir_entries = os.scandir(path)
+            except OSError as e:
+                if level == 0:
+                    raise
+                print(f"Cannot scan {path}: {e}", flush=True)
+                continue
+            with dir_entries:
+                for entry in dir_entries:
+                    name = entry.name
+                    # detect valid file name, `*.sw?`
+                    if name[-4:-1] == '.sw':
+                        try:
+                            yield path + '/' + name, entry.stat(follow_symlinks=False)
+                        except OSError: # removed in the meantime
+                            continue
+                    elif level < depth and entry.is_dir(follow_symlinks=False):
+                        stack.append((path + '/' + name, level + 1))
 
-                if vim.returncode == 0:
-                    print(f"vim recovered. Swap file {filename}", flush=True)
-                else:
-                    print(f"vim recover failed. Maybe the file is not valid or the script is not working. Swap file {filename}", flush=True)
-                    success = False
+    def find_candidates(self, dir: string, paths = None, since: datetime.datetime = None, dedup: bool = True):
+        """
+        List swap files in `dir` (or only those in `paths`, e.g. reported by a `SwapFileWatcher`)
+        modified since `since`, as SwapCandidate.
+        `since` defaults to `last_check` for a full scan. Given `paths` are not filtered by time by default:
+        they are known to have changed, and may be older than a report that ran while they were debounced.
+        Subdirectories are scanned up to `swapfinder.scan_depth` levels down.
+        With `dedup`, files unchanged since they were last reported are left out, and a full scan
+        forgets reported files that are gone.
+        `dir` should not end with '/'.
+        """
+        if dedup:
+            try:
+                self.index.load()
+            except sqlite3.Error as e:
+                print(f"Failed to load swap file index from {self.index.path}: {e}", flush=True)
 
-            except subprocess.TimeoutExpired:
-                print(f"vim session timeout. Maybe the file is too large or the script is not working. Swap file {filename}", flush=True)
-                success = False
+        if paths is None:
+            files = self.walk(dir, SCAN_DEPTH)
+        else:
+            files = []
+            for fullname in paths:
+                try:
+                    files.append((fullname, os.lstat(fullname)))
+                except OSError:
+                    continue
 
-        scriptfile.close()
+        if since is not None:
+            since = since.timestamp()
+        else:
+            since = self.last_check.timestamp() if paths is None else 0.0
+        candidates = []
+        seen = set()
+        for fullname, st in files:
+            seen.add((st.st_dev, st.st_ino))
+            candidate = self.check_candidate(fullname, st, since, dedup)
+            if candidate is not None:
+                candidates.append(candidate)
+        if dedup and paths is None:
+            self.index.prune(seen)
+        return candidates
 
-        if not success:
-            capturefile.close()
+    def submit(self, candidate, output = None):
+        """
+        Start recovering a candidate from `find_candidates` in the worker pool.
+        If `output` (a named temp file) is given, the full file is recovered into it and the future's result
+        is True, otherwise the result is the text of a preview. The result is None if recovery failed.
+        The time from submission to result is recorded in `swapfinder_recovery_seconds`.
+        """
+        start = time.perf_counter()
+        if output is not None:
+            future = self.get_pool().submit(recover_file, candidate.filename, output.name, RECOVER_TIMEOUT, VIM_FALLBACK,
+                                            MAX_FILE_SIZE)
+        else:
+            # A preview only needs the beginning of each file
+            future = self.get_pool().submit(recover_text, candidate.filename, PREVIEW_SIZE * PREVIEW_BYTES_PER_CHAR,
+                                            RECOVER_TIMEOUT, VIM_FALLBACK, MAX_FILE_SIZE)
+        mode = "preview" if output is None else "full"
+        future.add_done_callback(lambda future: future.cancelled() or
+                                 observe("swapfinder_recovery_seconds", time.perf_counter() - start, mode=mode))
+        return future
+
+    def finish(self, future, pending: dict, wrap = None):
+        """
+        Pop a finished recovery from `pending` (filled by `start_recoveries`) and return `(candidate, result, output)`.
+        A worker dying breaks its whole pool, failing every recovery in it and not only the one that crashed;
+        those are resubmitted to a new pool once, and None is returned for them instead.
+        The result is None if recovery failed, was cancelled, raised, or failed again after a retry.
+        """
+        recovery = pending.pop(future)
+        candidate, output = recovery.candidate, recovery.output
+        try:
+            return candidate, future.result(), output
+        except (CancelledError, asyncio.CancelledError):
+            return candidate, None, output
+        except BrokenProcessPool:
+            # The other recoveries of the same pool end up here too, only the first one replaces it
+            if self.pool is recovery.pool:
+                print("A swap file recovery worker died, restarting the pool", flush=True)
+                self.close_pool(cancel=False)
+            if recovery.retried:
+                return candidate, None, output
+            self.resubmit(recovery, pending, wrap)
             return None
-        
-        if getfile:
-            return capturefile
+        except Exception as e:
+            # e.g. MemoryError; one bad file must not end the scan
+            print(f"Recovering swap file {candidate.filename} failed ({e!r})", flush=True)
+            return candidate, None, output
+
+    def resubmit(self, recovery, pending: dict, wrap = None):
+        future = self.submit(recovery.candidate, recovery.output)
+        pending[wrap(future) if wrap else future] = Recovery(recovery.candidate, recovery.output, self.pool, future, True)
+
+    def recovery_limit(self):
+        """
+        Seconds a worker may spend on a recovery before it is killed.
+        vim may run for `swapfinder.recover_timeout` after the parser gave up, and a process pool hands each
+        worker the next recovery before the current one finished, so a recovery may look started that early.
+        """
+        return 2 * RECOVER_TIMEOUT + RECOVERY_GRACE
+
+    def wait_timeout(self, pending: dict):
+        """
+        Note which recoveries in `pending` a worker took, and return how long to wait for results before
+        checking `expire`, or None if there is nothing to check.
+        """
+        now = time.monotonic()
+        deadlines, queued = [], False
+        for recovery in pending.values():
+            if recovery.started is None and recovery.future.running():
+                recovery.started = now
+            if recovery.started is None:
+                queued = True
+            else:
+                deadlines.append(recovery.started + self.recovery_limit())
+        timeout = min(deadlines) - now if deadlines else None
+        if queued:
+            timeout = RECOVERY_POLL if timeout is None else min(timeout, RECOVERY_POLL)
+        return None if timeout is None else max(0, timeout)
+
+    def expire(self, pending: dict, wrap = None):
+        """
+        Drop recoveries of `pending` running past `recovery_limit` as failed, and kill the pool they are stuck in.
+        The parser keeps to its deadline by itself, but not while blocked in a system call.
+        The other unfinished recoveries of that pool are resubmitted once, as in `finish`.
+        """
+        now = time.monotonic()
+        expired = lambda recovery: recovery.started is not None and now - recovery.started >= self.recovery_limit()
+        for recovery in list(pending.values()):
+            if recovery.pool is None or not expired(recovery):
+                continue
+            print(f"Recovering swap file {recovery.candidate.filename} is stuck, restarting the pool", flush=True)
+            pool = recovery.pool
+            stranded = [(future, other) for future, other in pending.items() if other.pool is pool and not future.done()]
+            for future, other in stranded:
+                del pending[future]
+                future.cancel()
+                # Not looked at again by this loop
+                other.pool = None
+            self.terminate_pool(pool, recovery.processes)
+            for future, other in stranded:
+                if expired(other) or other.retried:
+                    if other.output is not None:
+                        other.output.close()
+                else:
+                    self.resubmit(other, pending, wrap)
+
+    def make_content(self, candidate, result, output = None, dedup: bool = True):
+        """
+        Build the SwapContent of a candidate from the `result` of `submit`, or return None if recovery failed.
+        The preview is `output`, rewound, if given, otherwise the first PREVIEW_SIZE characters.
+        With `dedup`, the preview is recorded in the index, and None is returned if it is the same as last reported.
+        """
+        if result is None:
+            if output is not None:
+                output.close()
+            return None
+        if output is not None:
+            text = output.read(PREVIEW_SIZE * PREVIEW_BYTES_PER_CHAR).decode(errors='replace')[:PREVIEW_SIZE]
+            output.seek(0)
         else:
-            content = capturefile.read()
-            capturefile.close()
-            return content
-    
+            text = result[:PREVIEW_SIZE]
+
+        previous = None
+        if dedup:
+            changed, previous = self.index.update(candidate.key, candidate.filename, candidate.mtime_ns,
+                                                  candidate.size, text)
+            if not changed:
+                if output is not None:
+                    output.close()
+                return None
+        return SwapContent(filename=candidate.filename, size=candidate.size, owner=candidate.owner,
+                           last_modify=candidate.last_modify, preview=text if output is None else output, previous=previous)
+
+    def start_recoveries(self, queue, pending: dict, keepfile: bool, wrap = None):
+        """
+        Submit candidates from the iterator `queue` until RECOVERY_WINDOW recoveries are pending in `pending`,
+        which maps each future (passed through `wrap` if given) to its `Recovery`.
+        Bounding the recoveries done ahead of the consumer bounds the open temp files and memory.
+        """
+        window = RECOVERY_WINDOW * max(WORKERS, 1)
+        for candidate in itertools.islice(queue, max(0, window - len(pending))):
+            output = tempfile.NamedTemporaryFile(mode='w+b') if keepfile else None
+            future = self.submit(candidate, output)
+            pending[wrap(future) if wrap else future] = Recovery(candidate, output, self.pool, future)
+
+    def cancel_recoveries(self, pending: dict):
+        for future, recovery in pending.items():
+            future.cancel()
+            if recovery.output is not None:
+                recovery.output.close()
+        pending.clear()
+
+    def recover_all(self, candidates, keepfile: bool = False, dedup: bool = True):
+        """
+        Recover `candidates` in parallel and yield their SwapContent in the order recoveries finish.
+        With `swapfinder.workers` processes and a `swapfinder.recover_timeout` deadline per file, a slow file
+        only holds up its own worker.
+        If `keepfile` is True, each file is recovered into a temp file; only a few are recovered ahead of the consumer.
+        """
+        queue, pending = iter(candidates), {}
+        try:
+            self.start_recoveries(queue, pending, keepfile)
+            while pending:
+                done, _ = wait(pending, self.wait_timeout(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished = self.finish(future, pending)
+                    if finished is None: # retried
+                        continue
+                    content = self.make_content(*finished, dedup=dedup)
+                    if content is not None:
+                        yield content
+                self.expire(pending)
+                self.start_recoveries(queue, pending, keepfile)
+        finally:
+            self.cancel_recoveries(pending)
+            if dedup:
+                self.save_index()
+
+    def save_index(self):
+        try:
+            self.index.save()
+        except sqlite3.Error as e:
+            print(f"Failed to save swap file index to {self.index.path}: {e}", flush=True)
+
+    @timed("swapfinder_scan_with_callback_seconds")
     def scan_with_callback(self, dir: string, callback, autoclose: bool = True):
         """
         Scan a given dir for newly created swap file.
         `dir` should not end with '/'.
         Call `callback(filename, size, owner, last_modify, tempfile)` when successfully recovered a swap file.
         tempfile is closed and deleted after callback.
+        Files are recovered in parallel, and `callback` is called in the order they finish.
         """
-        with os.scandir(dir) as dir_entries:
-            for entry in dir_entries:
+        self.scan_files(None, callback, autoclose, dir)
 
-                # detect file
-                if not entry.is_file(follow_symlinks=False):
-                    continue
+    def scan_files(self, paths, callback, autoclose: bool = True, dir: string = None):
+        """
+        Same as `scan_with_callback`, but only check the given swap file `paths`,
+        e.g. those reported by a `SwapFileWatcher`.
+        """
+        for content in self.recover_all(self.find_candidates(dir, paths), True):
+            callback(content.filename, content.size, content.owner, content.last_modify, content.preview)
+            if autoclose and not content.preview.closed:
+                content.preview.close()
 
-                # detect readable
-                st_mode = entry.stat(follow_symlinks=False).st_mode
-                if not st_mode & (stat.S_IRGRP):
-                    continue
-                
-                # detect valid file name
-                fullname = dir + '/' + entry.name
-                if not re.match(r"^.*\.sw.$", fullname):
-                    continue
+    def watch(self, dir: string, callback, debounce: float, loop):
+        """
+        Watch `dir` with inotify instead of polling it.
+        `callback(paths)` gets the set of swap files changed, or None if `dir` needs a full rescan.
+        Raise OSError if inotify cannot be used (e.g. the watch limit is hit), so the caller can fall back to polling.
+        """
+        watcher = SwapFileWatcher(dir, callback, debounce)
+        watcher.start(loop)
+        return watcher
 
-                # detect size <= MAX_FILE_SIZE
-                if entry.stat().st_size > MAX_FILE_SIZE:
-                    continue
 
-                last_modify = datetime.datetime.fromtimestamp(entry.stat().st_mtime)
-                if last_modify < self.last_check:
-                    continue
+    def scan_directory(self, dir: string, keepfile: bool = False, paths = None, since: datetime.datetime = None, dedup: bool = True):
+        """
+        Scan a given dir for newly created swap file.
+        `dir` should not end with '/'.
+        If `paths` is given, only those files are checked instead of the whole `dir`.
+        Files modified before `since` are skipped (by default: `last_check` for a full scan, none for `paths`).
+        With `dedup`, files are only returned if they changed since they were last returned, with the previous preview.
+        Return a list of SwapContent, in the order recoveries finished.
+        Blocking; use `iter_directory` from async code.
+        """
+        return list(self.recover_all(self.find_candidates(dir, paths, since, dedup), keepfile, dedup))
 
-                # recover swap file
-                owner = getpwuid(entry.stat().st_uid).pw_name
-                content = self.recover_swap_file(fullname, True)
-                if content != None:
-                    callback(fullname, entry.stat().st_size, owner, last_modify, content)
-                    if autoclose and not content.closed:
-                        content.close()
-        return
+    async def iter_directory(self, dir: string, keepfile: bool = False, paths = None, since: datetime.datetime = None, dedup: bool = True):
+        """
+        Async version of `scan_directory`: an async iterator of SwapContent.
+        Listing runs in a thread and recovery in the worker pool, so the event loop is never blocked.
+        Results come in the order recoveries finish, not in directory order.
+        """
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(self.get_executor(), self.find_candidates, dir, paths, since, dedup)
+        queue, pending = iter(candidates), {}
+        try:
+            self.start_recoveries(queue, pending, keepfile, asyncio.wrap_future)
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=self.wait_timeout(pending),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    finished = self.finish(future, pending, asyncio.wrap_future)
+                    if finished is None: # retried
+                        continue
+                    content = self.make_content(*finished, dedup=dedup)
+                    if content is not None:
+                        yield content
+                self.expire(pending, asyncio.wrap_future)
+                self.start_recoveries(queue, pending, keepfile, asyncio.wrap_future)
+        finally:
+            # The consumer stopped early: drop queued recoveries, and temp files nobody will read
+            self.cancel_recoveries(pending)
+            if dedup:
+                loop.run_in_executor(self.get_executor(), self.save_index)
 
+    def get_executor(self):
+        """Threads for blocking file system work."""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=max(WORKERS, 1), thread_name_prefix="swapfinder")
+        return self.executor
 
-    def scan_directory(self, dir: string, keepfile: bool = False):
+    def get_pool(self):
         """
-        Scan a given dir for newly created swap file.
-        `dir` should not end with '/'.
-        Return a list of SwapContent.
+        The pool recovering swap files: `swapfinder.workers` processes, as parsing is CPU bound.
+        With 1 worker or less, a single thread recovers files one by one instead.
         """
-        recovered_list = []
-        def callback(filename, size, owner, last_modify, tempfile):
-            if keepfile:
-                preview = tempfile
+        if self.pool is None:
+            if WORKERS > 1:
+                # Do not fork the bot with all its threads; workers start from a clean server process
+                self.pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("forkserver"))
             else:
-                preview = tempfile.read()[:PREVIEW_SIZE]
-            recovered_list.append(SwapContent(filename=filename, size=size, owner=owner, last_modify=last_modify, preview=preview))
+                self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="swapfinder-recover")
+        return self.pool
+
+    def close_pool(self, cancel: bool = True):
+        """Stop the recovery pool; the next recovery starts a new one. Unless `cancel`, queued recoveries still run."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=cancel)
+            self.pool = None
+
+    def terminate_pool(self, pool, processes: dict | None = None):
+        """
+        Kill the worker `processes` of `pool`, stuck ones included, failing its recoveries;
+        the next recovery starts a new pool.
+        Threads cannot be killed: a stuck thread is left behind, and only its pool replaced.
+        """
+        if self.pool is pool:
+            self.pool = None
+        # Shutting down alone waits for the workers to finish their current recovery, which a stuck one never does
+        for process in list((processes or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
 
-        self.scan_with_callback(dir, callback, not keepfile)
-        return recovered_list
+    def close(self):
+        """Stop the workers; queued recoveries are dropped."""
+        self.close_pool()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
 
 if __name__ == '__main__':
     sf = VimSwapFileFinder()
@@ -0,0 +1,318 @@
+"""
+Read vim swap files directly, without running `vim -r`.
+
+A swap file is a sequence of pages. Block 0 holds the header (`struct block0` in vim's memline.c),
+block 1 is the root of a tree of pointer blocks whose leaves are data blocks holding the text lines.
+Structures are written in the native layout of the machine that wrote them, which is detected from the
+magic numbers at the end of block 0.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import stat
+import struct
+import time
+from collections.abc import Iterator
+
+BLOCK0_ID = b"b0"
+DATA_ID = (ord('d') << 8) + ord('a')
+PTR_ID = (ord('p') << 8) + ord('t')
+DB_INDEX_MASK = 0x7fffffff
+
+# Offsets in block 0
+B0_PAGE_SIZE = 12
+B0_UNAME = 28
+B0_UNAME_SIZE = 40
+B0_FNAME = 108
+B0_FNAME_SIZE_ORG = 900
+B0_FLAGS = B0_FNAME + B0_FNAME_SIZE_ORG - 2
+B0_MAGIC = B0_FNAME + B0_FNAME_SIZE_ORG
+B0_FF_MASK = 3
+B0_SAME_DIR = 4
+
+B0_MAGIC_LONG = 0x30313233
+B0_MAGIC_INT = 0x20212223
+B0_MAGIC_SHORT = 0x1213
+B0_MAGIC_CHAR = 0x55
+
+# Line endings by 'fileformat' (unix, dos, mac), as stored in the block 0 flags
+LINE_ENDINGS = [b"\n", b"\r\n", b"\r"]
+
+# What vim recovers in place of lines it cannot find
+LINES_MISSING = b"???LINES MISSING"
+
+# A sane tree is a few levels deep; anything deeper is a corrupt (possibly cyclic) file
+MAX_DEPTH = 32
+
+# The edited file is read this many bytes at a time, checking the deadline in between
+ORIGINAL_CHUNK_SIZE = 1 << 16
+
+
+class SwapParseError(Exception):
+    pass
+
+
+class SwapParseTimeout(SwapParseError):
+    pass
+
+
+class Layout:
+    """Native struct layout of the machine that wrote the swap file."""
+
+    def __init__(self, endian: str, long_size: int):
+        l = "q" if long_size == 8 else "i"
+        self.endian: str = endian
+        # struct data_block { short_u id; unsigned free, txt_start, txt_end; linenr_T line_count; unsigned index[]; }
+        self.data_header = struct.Struct(f"{endian}H2xIII{l}")
+        self.index = struct.Struct(f"{endian}I")
+        # struct pointer_block { short_u id, count, count_max; PTR_EN pointer[]; }, entries aligned to 8 bytes
+        self.ptr_header = struct.Struct(f"{endian}HHH")
+        self.ptr_offset: int = 8
+        # PTR_EN { blocknr_T bnum; linenr_T line_count; linenr_T old_lnum; int page_count; }
+        self.ptr_entry = struct.Struct(f"{endian}{l}{l}{l}i{'4x' if long_size == 8 else ''}")
+
+    @classmethod
+    def detect(cls, block0: bytes) -> Layout:
+        for endian in "<>":
+            for long_size in (8, 4):
+                l = "q" if long_size == 8 else "i"
+                try:
+                    magic = struct.unpack_from(f"{endian}{l}ihB", block0, B0_MAGIC)
+                except struct.error:
+                    raise SwapParseError("block 0 is truncated")
+                if magic == (B0_MAGIC_LONG, B0_MAGIC_INT, B0_MAGIC_SHORT, B0_MAGIC_CHAR):
+                    return cls(endian, long_size)
+        raise SwapParseError("unknown byte order or word size")
+
+
+class VimSwapParser:
+    def __init__(self, f, deadline: float | None = None, max_original_size: int | None = None):
+        """
+        Parse the header of the swap file opened in binary mode as `f`.
+        Raise SwapParseError if it is not a swap file this parser can read, e.g. an encrypted one.
+        Reading raises SwapParseTimeout once `time.monotonic()` passes `deadline`.
+        The edited file is not read if it is larger than `max_original_size` bytes.
+        """
+        self.f = f
+        self.deadline: float | None = deadline
+        self.max_original_size: int | None = max_original_size
+        block0 = f.read(B0_MAGIC + 16)
+        if block0[:2] != BLOCK0_ID:
+            raise SwapParseError(f"not a readable swap file (block 0 id {block0[:2]!r})")
+        self.layout: Layout = Layout.detect(block0)
+        self.page_size: int = int.from_bytes(block0[B0_PAGE_SIZE:B0_PAGE_SIZE + 4], "little")
+        if self.page_size < 256 or self.page_size & (self.page_size - 1):
+            raise SwapParseError(f"bad page size {self.page_size}")
+        flags = block0[B0_FLAGS]
+        fileformat = (flags & B0_FF_MASK) - 1
+        self.line_ending: bytes = LINE_ENDINGS[fileformat] if fileformat >= 0 else b"\n"
+        self.same_dir: bool = bool(flags & B0_SAME_DIR)
+        self.uname: str = os.fsdecode(block0[B0_UNAME:B0_UNAME + B0_UNAME_SIZE].split(b"\0", 1)[0])
+        # The file encoding may be stored after the name, behind a NUL
+        self.fname: str = os.fsdecode(block0[B0_FNAME:B0_FLAGS].split(b"\0", 1)[0])
+        # Lines of the edited file not read yet, and how many were read
+        self._original: Iterator[bytes] | None = None
+        self._original_lnum: int = 0
+
+    @classmethod
+    def read_file(cls, filename: str, limit: int | None = None, timeout: float | None = None,
+                  max_original_size: int | None = None) -> bytes:
+        """Open and parse `filename` within `timeout` seconds, see `read`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with open(filename, "rb") as f:
+            return cls(f, deadline, max_original_size).read(limit)
+
+    @classmethod
+    def write_file(cls, filename: str, out, timeout: float | None = None, max_original_size: int | None = None) -> int:
+        """Open and parse `filename` within `timeout` seconds into `out`, see `write`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with open(filename, "rb") as f:
+            return cls(f, deadline, max_original_size).write(out)
+
+    def check_deadline(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SwapParseTimeout("deadline exceeded")
+
+    def original_path(self) -> str | None:
+        """Locate the edited file, the way vim does when recovering. Return None if unknown."""
+        if not self.fname:
+            return None
+        # Names under the home directory are stored as "~/...", of the user who ran vim
+        path = os.path.expanduser("~" + self.uname + self.fname[1:]) if self.fname.startswith("~/") else self.fname
+        swap_dir = os.path.dirname(os.path.abspath(getattr(self.f, "name", "")))
+        if not os.path.isabs(path) or (self.same_dir and not os.path.exists(path)):
+            path = os.path.join(swap_dir, os.path.basename(path))
+        return path
+
+    def open_original(self):
+        """
+        Open the edited file in binary mode and return it with its size, or None if it cannot be used.
+        Its name comes from whoever wrote the swap file, so only a regular file of at most `max_original_size`
+        bytes is accepted, and it is opened without blocking (e.g. on a FIFO).
+        """
+        path = self.original_path()
+        if path is None:
+            return None
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | os.O_NOCTTY)
+        except OSError:
+            return None
+        try:
+            st = os.fstat(fd)
+        except OSError:
+            os.close(fd)
+            return None
+        if not stat.S_ISREG(st.st_mode) or (self.max_original_size is not None and st.st_size > self.max_original_size):
+            os.close(fd)
+            return None
+        return os.fdopen(fd, "rb"), st.st_size
+
+    def iter_original(self) -> Iterator[bytes]:
+        """
+        Yield the lines of the edited file (see `open_original`) as they are read, a chunk at a time.
+        Only the size it had when opened is read, and reading stops at an error.
+        """
+        opened = self.open_original()
+        if opened is None:
+            return
+        f, size = opened
+        with f:
+            rest = b""
+            while size > 0:
+                self.check_deadline()
+                try:
+                    chunk = f.read(min(ORIGINAL_CHUNK_SIZE, size))
+                except OSError:
+                    break
+                if not chunk:
+                    break
+                size -= len(chunk)
+                lines = (rest + chunk).split(self.line_ending)
+                rest = lines.pop()
+                yield from lines
+            if rest:
+                yield rest
+
+    def original_lines(self, lines: range) -> Iterator[bytes]:
+        """
+        Yield `lines` (0-based) of the edited file as it was last written, followed by a single `LINES_MISSING`
+        line if it ends before them or cannot be read.
+        The file is only read as far as needed, so ranges must be asked for in increasing order.
+        """
+        if self._original is None:
+            self._original = self.iter_original()
+        if not lines:
+            return
+        if lines.start < self._original_lnum:
+            # Already read past them
+            yield LINES_MISSING
+            return
+        for line in self._original:
+            self._original_lnum += 1
+            if self._original_lnum > lines.start:
+                yield line
+                if self._original_lnum >= lines.stop:
+                    return
+        yield LINES_MISSING
+
+    def read_block(self, bnum: int, page_count: int = 1) -> bytes:
+        if bnum <= 0:
+            raise SwapParseError(f"bad block number {bnum}")
+        self.check_deadline()
+        self.f.seek(bnum * self.page_size)
+        block = self.f.read(page_count * self.page_size)
+        if len(block) != page_count * self.page_size:
+            raise SwapParseError(f"block {bnum} is truncated")
+        return block
+
+    def iter_data_blocks(self, bnum: int = 1, page_count: int = 1, depth: int = 0) -> Iterator[bytes | range]:
+        """
+        Walk the block tree from `bnum` and yield its data blocks in line order.
+        For a data block that was never written to the swap file, the range of lines it held in the
+        edited file is yielded instead.
+        """
+        if depth > MAX_DEPTH:
+            raise SwapParseError("block tree is too deep")
+        block = self.read_block(bnum, page_count)
+        (id,) = struct.unpack_from(f"{self.layout.endian}H", block)
+        if id == DATA_ID:
+            yield block
+        elif id == PTR_ID:
+            _, count, count_max = self.layout.ptr_header.unpack_from(block)
+            if count > count_max:
+                raise SwapParseError(f"pointer block {bnum} has {count} > {count_max} entries")
+            for i in range(count):
+                child, line_count, old_lnum, child_pages = self.layout.ptr_entry.unpack_from(
+                    block, self.layout.ptr_offset + i * self.layout.ptr_entry.size)
+                # Negative numbers are blocks that only ever lived in vim's memory
+                if child < 0:
+                    yield range(old_lnum - 1, old_lnum - 1 + line_count)
+                    continue
+                yield from self.iter_data_blocks(child, child_pages, depth + 1)
+        else:
+            raise SwapParseError(f"block {bnum} has unknown id {id:#x}")
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """
+        Yield the text lines, without line endings.
+        Like vim, lines of blocks that were never written are taken from the edited file,
+        or replaced by a single `LINES_MISSING` line if it cannot be read.
+        """
+        try:
+            yield from self._iter_lines()
+        finally:
+            # Stopped early or failed: do not keep the edited file open
+            if self._original is not None:
+                self._original.close()
+
+    def _iter_lines(self) -> Iterator[bytes]:
+        for block in self.iter_data_blocks():
+            if isinstance(block, range):
+                if block.start >= 0:
+                    yield from self.original_lines(block)
+                else:
+                    yield LINES_MISSING
+                continue
+            _, _, txt_start, txt_end, line_count = self.layout.data_header.unpack_from(block)
+            index_offset = self.layout.data_header.size
+            if txt_end > len(block) or index_offset + line_count * self.layout.index.size > txt_start:
+                raise SwapParseError("data block header is inconsistent")
+            # Lines are stored backwards from the end of the block; line i ends where line i - 1 starts
+            end = txt_end
+            for i in range(line_count):
+                (start,) = self.layout.index.unpack_from(block, index_offset + i * self.layout.index.size)
+                start &= DB_INDEX_MASK
+                if not txt_start <= start <= end:
+                    raise SwapParseError("data block line index is out of range")
+                # Text properties may follow the terminating NUL
+                yield block[start:end].split(b"\0", 1)[0]
+                end = start
+
+    def write(self, out, limit: int | None = None) -> int:
+        r"""
+        Reconstruct the edited file into the binary file object `out`, a line at a time,
+        and return the number of bytes written.
+
+        :param limit: Stop once this many bytes are written.
+        """
+        size = 0
+        for line in self.iter_lines():
+            chunk = line + self.line_ending
+            if limit is not None and size + len(chunk) >= limit:
+                out.write(chunk[:limit - size])
+                return limit
+            out.write(chunk)
+            size += len(chunk)
+        return size
+
+    def read(self, limit: int | None = None) -> bytes:
+        r"""
+        Reconstruct the edited file.
+
+        :param limit: Stop once at least this many bytes are reconstructed; the result is cut to `limit`.
+        """
+        out = io.BytesIO()
+        self.write(out, limit)
+        return out.getvalue()